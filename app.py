@@ -1,15 +1,23 @@
 from aiohttp import web
 from aiohttp.web import json_response
-from cmdb import add_schema, add_field, add_entity
-from cmdb import update_schema, update_field, update_entity, iter_schema, unique_fields
+from cmdb import add_schema, add_field, add_entity, add_entities
+from cmdb import update_schema, update_field, update_entity, relation_catalog, column_tree
 from cmdb import delete_entity, delete_field, delete_schema
 from cmdb import list_schema, list_field, list_record, list_value, list_relation_record
 from cmdb import iter_record, iter_value, iter_relation_record
 from cmdb.tools import RET, getmsg, get_logger, types
+from cmdb.search import search
+from cmdb.cache import results
+from cmdb.importer import import_file, report_path
+from cmdb.groupcommit import committer
+from cmdb.planner import refresh_stats, STATS_INTERVAL
 from cmdb.exceptions import CMDBError
+from cmdb.models import session
 import settings
+import asyncio
 import json
-import xlrd
+import uuid
+import os
 import xlwt
 
 
@@ -34,8 +42,11 @@ async def table(request: web.Request):
     except TypeError:
         query = {}
 
+    cursor = request.query.get("cursor")
+    count = request.query.get("count", "exact")
+
     try:
-        schemas, pagination = list_schema(page, size, query)
+        schemas, pagination = list_schema(page, size, query, cursor=cursor, count=count)
 
         schemas = [{
             "id": schema.id,
@@ -93,24 +104,7 @@ async def all_column(request: web.Request):
         return jsonify(errno=RET.PARAMERR, errmsg=getmsg(RET.PARAMERR))
 
     try:
-        fields = list_field(id_)
-        fields = [{
-            "key": field.id,
-            "title": field.name,
-            "ref": field.ref,
-            "meta": json.loads(field.meta),
-            "description": field.desc,
-        } for field in fields]
-        for field in fields:
-            ref = field.get("ref")
-            if ref:
-                fields.extend([{
-                    "key": f'{field["key"]}-{f.id}',
-                    "title": f'{field["title"]}{f.name}',
-                    "meta": json.loads(f.meta),
-                    "description": f.desc
-                } for f in list_field(field_id=ref) if f.id != ref])
-
+        fields = column_tree(id_)
     except ValueError:
         return jsonify(errno=RET.VERR, errmsg=getmsg(RET.VERR))
     except CMDBError as e:
@@ -137,13 +131,16 @@ async def row(request: web.Request):
         query = {}
     schema_id = request.query.get("schema_id")
     query_fields = request.query.getall("fields", [])
+    cursor = request.query.get("cursor")
+    count = request.query.get("count", "exact")
 
     if not schema_id:
         return jsonify(errno=RET.PARAMERR, errmsg=getmsg(RET.PARAMERR))
 
     try:
         records, pagination = \
-            list_record(schema_id=schema_id, query_fields=query_fields, page=page, size=size, query=query)
+            list_record(schema_id=schema_id, query_fields=query_fields, page=page, size=size, query=query,
+                        cursor=cursor, count=count)
         data = dict(data=records, pagination=pagination)
     except ValueError:
         return jsonify(errno=RET.VERR, errmsg=getmsg(RET.VERR))
@@ -171,15 +168,15 @@ async def relation_row(request: web.Request):
         query = {}
     schema_id = request.query.get("schema_id")
     query_fields = request.query.getall("fields", [])
+    cursor = request.query.get("cursor")
+    count = request.query.get("count", "exact")
 
     if not schema_id:
         return jsonify(errno=RET.PARAMERR, errmsg=getmsg(RET.PARAMERR))
-    records, pagination = \
-        list_relation_record(schema_id=schema_id, query_fields=query_fields, page=page, size=size, query=query)
-    data = dict(data=records, pagination=pagination)
     try:
         records, pagination = \
-            list_relation_record(schema_id=schema_id, query_fields=query_fields, page=page, size=size, query=query)
+            list_relation_record(schema_id=schema_id, query_fields=query_fields, page=page, size=size, query=query,
+                                 cursor=cursor, count=count)
         data = dict(data=records, pagination=pagination)
     except ValueError:
         return jsonify(errno=RET.VERR, errmsg=getmsg(RET.VERR))
@@ -240,7 +237,10 @@ async def post_row(request: web.Request):
     if not schema_id:
         return jsonify(errno=RET.PARAMERR, errmsg=getmsg(RET.PARAMERR))
     try:
-        add_entity(schema_id=schema_id, values=values)
+        if settings.GROUP_COMMIT:
+            await committer.add(schema_id, values)
+        else:
+            add_entity(schema_id=schema_id, values=values)
     except ValueError:
         return jsonify(errno=RET.VERR, errmsg=getmsg(RET.VERR))
     except CMDBError as e:
@@ -267,13 +267,12 @@ async def post_many_row(request: web.Request):
         if ref:
             id_ = ref.get("id")
             name = ref.get("name")
-            for val in iter_value(id_):
-                values.update({name: val.value})
-                add_entity(schema_id=schema_id, values=values)
+            rows = [dict(values, **{name: val.value}) for val in iter_value(id_)]
         else:
-            count = int(count)
-            for i in range(count):
-                add_entity(schema_id=schema_id, values=values)
+            rows = [values] * int(count)
+        errors = add_entities(schema_id=schema_id, rows=rows)
+        if errors:
+            return jsonify(errno=errors[0]["errno"], errmsg=getmsg(errors[0]["errno"]), data=errors)
     except ValueError:
         return jsonify(errno=RET.PARAMERR, errmsg="参数错误")
     except ValueError:
@@ -380,7 +379,7 @@ async def put_column(request: web.Request):
     except ValueError:
         return jsonify(errno=RET.VERR, errmsg=getmsg(RET.VERR))
     except CMDBError as e:
-        return jsonify(errno=e.no, errmsg=getmsg(e.no))
+        return jsonify(errno=e.no, errmsg=getmsg(e.no), data=e.data)
     except Exception as e:
         logger.error(e)
         return jsonify(errno=RET.UNKNOWN, errmsg=getmsg(RET.UNKNOWN))
@@ -418,20 +417,16 @@ async def all_type(request: web.Request):
 
 async def relations(request: web.Request):
     try:
-        schemas = iter_schema()
-        data = []
-        for schema in schemas:
-            fields = unique_fields(schema.id)
-            data.append({
-                "value": schema.id,
-                "label": schema.name,
-                "children": fields,
-                "disabled": False if fields else True
-            })
+        data, etag = relation_catalog()
     except Exception as e:
         logger.error(e)
         return jsonify(errno=RET.UNKNOWN, errmsg=getmsg(RET.UNKNOWN))
-    return jsonify(errno=RET.OK, errmsg=getmsg(RET.OK), data=data)
+    etag = f'"{etag}"'
+    if request.headers.get("If-None-Match") == etag:
+        return web.Response(status=304, headers={"ETag": etag})
+    response = jsonify(errno=RET.OK, errmsg=getmsg(RET.OK), data=data)
+    response.headers["ETag"] = etag
+    return response
 
 
 async def value(request: web.Request) -> web.Response:
@@ -447,49 +442,95 @@ async def value(request: web.Request) -> web.Response:
         size = int(request.query.get('size', 20))
     except ValueError:
         size = 20
+    cursor = request.query.get("cursor")
+    count = request.query.get("count", "exact")
     try:
-        values, pagination = list_value(id_=ref, page=page, size=size)
+        values, pagination = list_value(id_=ref, page=page, size=size, cursor=cursor, count=count)
         data = [v.value for v in values]
+    except ValueError:
+        return jsonify(errno=RET.VERR, errmsg=getmsg(RET.VERR))
     except Exception as e:
         logger.error(e)
         return jsonify(errno=RET.UNKNOWN, errmsg=getmsg(RET.UNKNOWN))
     return jsonify(errno=RET.OK, errmsg=getmsg(RET.OK), data=dict(data=data, pagination=pagination))
 
 
-def _iter_row(io_):
-    book = xlrd.open_workbook(file_contents=io_.read())
-    sheet = book.sheet_by_index(0)
-    nrows = sheet.nrows
-    for row in range(nrows):
-        yield sheet.row_values(row)
+async def search_row(request: web.Request) -> web.Response:
+    term = request.query.get('q')
+    if not term:
+        return jsonify(errno=RET.PARAMERR, errmsg=getmsg(RET.PARAMERR))
+    schema_id = request.query.get('schema_id')
+    try:
+        size = int(request.query.get('size', 20))
+    except ValueError:
+        size = 20
+    try:
+        data = search(term, schema_id=schema_id, size=size)
+    except Exception as e:
+        logger.error(e)
+        return jsonify(errno=RET.UNKNOWN, errmsg=getmsg(RET.UNKNOWN))
+    return jsonify(errno=RET.OK, errmsg=getmsg(RET.OK), data=data)
+
+
+async def cache_stats(request: web.Request) -> web.Response:
+    return jsonify(errno=RET.OK, errmsg=getmsg(RET.OK), data=results.stats())
 
 
 async def upload(request: web.Request):
-    payload = await request.post()
-    file = payload.get("file")
-    schema_id = payload.get('schema_id')
-    if not all((file, schema_id)):
-        return jsonify(errno=RET.PARAMERR, errmsg=getmsg(RET.PARAMERR))
-    try:
-        data = _iter_row(file.file)
-        header = next(data)
-        fields = [field.name for field in list_field(schema_id)]
-        assert set(header) & set(fields)
+    """ 上传文件流式写入临时文件，在线程池中分批导入，返回导入结果及错误报告 ID """
+    schema_id = path = filename = None
+    try:
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == "schema_id":
+                schema_id = await part.text()
+            elif part.name == "file":
+                filename = part.filename
+                os.makedirs(settings.IMPORT_PATH, exist_ok=True)
+                path = os.path.join(settings.IMPORT_PATH, f"upload-{uuid.uuid4().hex}")
+                with open(path, "wb") as f:
+                    while True:
+                        chunk = await part.read_chunk()
+                        if not chunk:
+                            break
+                        f.write(chunk)
     except Exception as e:
+        logger.error(e)
+        if path and os.path.exists(path):
+            os.remove(path)
         return jsonify(errno=RET.UPERR, errmsg=getmsg(RET.UPERR))
+    if not all((path, schema_id)):
+        if path:
+            os.remove(path)
+        return jsonify(errno=RET.PARAMERR, errmsg=getmsg(RET.PARAMERR))
 
     try:
-        for row_values in data:
-            add_entity(schema_id, dict(zip(header, row_values)))
+        loop = asyncio.get_event_loop()
+        data = await loop.run_in_executor(None, import_file, schema_id, path, filename)
     except ValueError:
-        return jsonify(errno=RET.VERR, errmsg=getmsg(RET.VERR))
+        return jsonify(errno=RET.UPERR, errmsg=getmsg(RET.UPERR))
     except CMDBError as e:
         return jsonify(errno=e.no, errmsg=getmsg(e.no))
     except Exception as e:
         logger.error(e)
         return jsonify(errno=RET.UNKNOWN, errmsg=getmsg(RET.UNKNOWN))
+    finally:
+        os.remove(path)
 
-    return jsonify(errno=RET.OK, errmsg=getmsg(RET.OK))
+    return jsonify(errno=RET.OK, errmsg=getmsg(RET.OK), data=data)
+
+
+async def upload_report(request: web.Request):
+    id_ = request.query.get("id")
+    if not id_:
+        return jsonify(errno=RET.PARAMERR, errmsg=getmsg(RET.PARAMERR))
+    try:
+        path = report_path(id_)
+    except ValueError:
+        return jsonify(errno=RET.PARAMERR, errmsg=getmsg(RET.PARAMERR))
+    if not os.path.exists(path):
+        return jsonify(errno=RET.VERR, errmsg=getmsg(RET.VERR))
+    return web.FileResponse(path, headers={'Content-Disposition': f'attachment;filename={id_}.csv'})
 
 
 def _generate_excel_io(schema_id, query, query_fields):
@@ -651,7 +692,37 @@ async def login_account(request: web.Request):
     })
 
 
-app = web.Application()
+@web.middleware
+async def session_scope(request: web.Request, handler):
+    """ 请求结束时释放事件循环线程的会话，下一个请求开启新事务，能读到其他线程（导入、组提交）已提交的数据 """
+    try:
+        return await handler(request)
+    finally:
+        session.remove()
+
+
+async def _refresh_stats():
+    """ 定期在线程池中刷新查询规划使用的字段统计信息 """
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, refresh_stats)
+        except Exception as e:
+            logger.error(e)
+        await asyncio.sleep(STATS_INTERVAL)
+
+
+async def start_background(app_: web.Application):
+    app_["stats_task"] = asyncio.ensure_future(_refresh_stats())
+
+
+async def stop_background(app_: web.Application):
+    app_["stats_task"].cancel()
+
+
+app = web.Application(middlewares=[session_scope])
+app.on_startup.append(start_background)
+app.on_cleanup.append(stop_background)
 app.router.add_get("/table", table)
 app.router.add_post("/table", post_table)
 app.router.add_delete("/table", delete_table)
@@ -670,9 +741,15 @@ app.router.add_put("/row", put_row)
 app.router.add_get("/types", all_type)
 app.router.add_get("/relations", relations)
 app.router.add_get("/value", value)
+app.router.add_get("/search", search_row)
+app.router.add_get("/cache_stats", cache_stats)
 app.router.add_route("*", "/upload", upload)
+app.router.add_get("/upload_report", upload_report)
 app.router.add_post("/download", download)
 app.router.add_post("/relation_download", relation_download)
 app.router.add_get("/currentUser", currentUser)
 app.router.add_post("/login/account", login_account)
-web.run_app(app, host=settings.HOST, port=settings.PORT)
+
+
+if __name__ == '__main__':  # 校验进程池以 spawn 方式启动子进程时会重新导入本模块
+    web.run_app(app, host=settings.HOST, port=settings.PORT)
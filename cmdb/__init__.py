@@ -1,11 +1,22 @@
-from cmdb.models import session, Schema, Field, Entity, Value
-from cmdb.tools import get_logger, FieldMeta, pagination, itemiter
+from cmdb.models import session, Schema, Field, Entity, Value, Token
+from cmdb.tools import get_logger, FieldMeta, pagination, itemiter, chunked, value_hash
 from cmdb.exceptions import *
+from cmdb.catalog import catalog
+from cmdb.planner import plan
+from cmdb.search import index_value, unindex_value, index_values, index_field
+from cmdb import projection, cache, fieldcheck
+from cmdb.validation import validate_rows
+from cmdb.cascade import Cascade
+from sqlalchemy import select, literal, func
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 import uuid
+import json
 
 logger = get_logger("cmdb", is_print=False)
 
+DELETE_CHUNK = 5000  # 批量软删除时每批提交的行数
+
 
 def add_schema(name: str, desc: str = None):
     try:
@@ -16,19 +27,51 @@ def add_schema(name: str, desc: str = None):
         logger.error(e)
         session.rollback()
         raise e
+    finally:
+        catalog.invalidate()
 
 
-def delete_schema(id_: int):
-    schema = session.query(Schema).get(id_)
+def _soft_delete(model, cond, progress=None):
+    """
+    按主键分批软删除满足条件的行，每批单独提交；中途失败时已提交的批次保留，重新执行即可继续
+    :param progress: 进度回调 progress(表名, 已删除行数)
+    """
+    done, last = 0, 0
+    while True:
+        ids = [row[0] for row in session.query(model.id)
+               .filter(cond & (model.is_delete==False) & (model.id > last)).order_by(model.id).limit(DELETE_CHUNK)]
+        if not ids:
+            break
+        columns = {model.is_delete: True}
+        if model is Value:
+            columns[Value.unique_hash] = None
+            session.query(Token).filter(Token.value_id.in_(ids)).delete(synchronize_session=False)
+        session.query(model).filter(model.id.in_(ids)).update(columns, synchronize_session=False)
+        session.commit()
+        done, last = done + len(ids), ids[-1]
+        if progress:
+            progress(model.__tablename__, done)
+    return done
+
+
+def delete_schema(id_: int, progress=None):
+    """
+    删除表：外部关联每个字段只检查一次，值、实体、字段分批批量软删除
+    :param progress: 进度回调 progress(表名, 已删除行数)
+    """
+    schema = session.query(Schema).filter((Schema.is_delete==False)&(Schema.id==id_)).first()
     if schema is None:
         raise ValueError(f"Schema with ID {id_} does not exist")
+    fields = list_field(schema_id=id_)
+    for field in fields:
+        if any(ref_field.schema_id != schema.id for ref_field in catalog.referencing(field.id)):
+            raise CMDBFieldError(1106, f'Cannot delete field {field.name} because there are dependencies')
     try:
-        fields = list_field(schema_id=id_)
-        for field in fields:
-            delete_field(field.id)
-        entities = iter_entity(id_)
-        for entity in entities:
-            delete_entity(entity.id)
+        if fields:
+            _soft_delete(Value, Value.field_id.in_([field.id for field in fields]), progress)
+        _soft_delete(Entity, Entity.schema_id==schema.id, progress)
+        session.query(Field).filter((Field.is_delete==False)&(Field.schema_id==schema.id)) \
+            .update({Field.is_delete: True}, synchronize_session=False)
         schema.is_delete = True
         session.add(schema)
         session.commit()
@@ -36,6 +79,10 @@ def delete_schema(id_: int):
         logger.error(e)
         session.rollback()
         raise e
+    finally:
+        catalog.invalidate()
+    logger.info(f"schema {schema.id}: deleted")
+    projection.drop(id_)
 
 
 def update_schema(id_: int, name: str, desc: str=None):
@@ -54,9 +101,11 @@ def update_schema(id_: int, name: str, desc: str=None):
         logger.error(e)
         session.rollback()
         raise e
+    finally:
+        catalog.invalidate()
 
 
-def list_schema(page: int = 1, size: int = 20, query: {} = None):
+def list_schema(page: int = 1, size: int = 20, query: {} = None, cursor: str = None, count: str = "exact"):
     cond = Schema.is_delete == False
     if query:
         name = query.get("name")
@@ -71,7 +120,7 @@ def list_schema(page: int = 1, size: int = 20, query: {} = None):
             cond &= Schema.createtime > created
 
     query = session.query(Schema).filter(cond)
-    return pagination(size=size, page=page, query=query)
+    return pagination(size=size, page=page, query=query, cursor=cursor, count=count)
 
 
 def iter_schema():
@@ -80,19 +129,21 @@ def iter_schema():
 
 
 def unique_fields(schema_id):
-    fields = list_field(schema_id=schema_id)
-    data = []
-    for field in fields:
-        meta = FieldMeta().loads(field.meta)
-        if meta.unique:
-            data.append({
-                "value": field.id,
-                "label": field.name
-            })
-    return data
+    return [{
+        "value": field.id,
+        "label": field.name
+    } for field in catalog.unique_fields(schema_id)]
+
+
+def relation_catalog() -> tuple:
+    """
+    表 -> 唯一字段 的关联目录，随字段目录一起加载
+    :return: (data, etag)
+    """
+    return catalog.relations()
 
 
-def _add_field(name: str, schema_id: int, meta: dict, desc: str = None, ref: id = None):
+def _add_field(name: str, schema_id: int, meta: dict, desc: str = None, ref: id = None, unique: bool = False):
     try:
         field = Field()
         field.name = name
@@ -100,12 +151,15 @@ def _add_field(name: str, schema_id: int, meta: dict, desc: str = None, ref: id
         field.schema_id = schema_id
         field.meta = meta
         field.ref = ref
+        field.unique = unique
         session.add(field)
         session.commit()
     except Exception as e:
         logger.error(e)
         session.rollback()
         raise e
+    finally:
+        catalog.invalidate()
     return field
 
 
@@ -129,11 +183,10 @@ def add_field(name: str, schema_id: int, desc: str = None, type: str = "String",
 
     if meta.relation and meta.relation.target:
 
-        ref_field = session.query(Field)\
-            .filter((Field.is_delete==False)&(Field.id==meta.relation.target)).first()
+        ref_field = catalog.field(meta.relation.target)
         if ref_field is None:  # 关联字段不存在
             raise CMDBFieldError(1101, "Associated field does not exist")
-        ref_meta = FieldMeta().loads(ref_field.meta)
+        ref_meta = ref_field.fieldmeta
         if not ref_meta.unique:
             raise CMDBFieldError(1102, "Non unique field cannot be a foreign key")
         if not meta.equal(ref_meta, nullable=False):  # 关联字段元属性不合法
@@ -142,32 +195,59 @@ def add_field(name: str, schema_id: int, desc: str = None, type: str = "String",
 
     has_entity = session.query(Entity).filter((Entity.is_delete==False)&(Entity.schema_id==schema_id)).first()
     if not has_entity:
-        _add_field(name=name, schema_id=schema_id, desc=desc, meta=meta.dumps(), ref=ref_id)
+        field = _add_field(name=name, schema_id=schema_id, desc=desc, meta=meta.dumps(), ref=ref_id, unique=meta.unique)
+        projection.add_column(field)
     else:
         if meta.unique:
             raise CMDBFieldError(1104, "Cannot set unique index because table is not empty")
         if not meta.nullable:
             if not meta.default:
                 raise CMDBFieldError(1105, "Cannot add field because field does have default value")
-
-        field = _add_field(name=name, schema_id=schema_id, desc=desc, meta=meta.dumps(), ref=ref_id)
         try:
-            entities = iter_entity(schema_id)
-            for entity in entities:
-                _add_value(meta=meta, value=meta.default, entity=entity, field=field)
+            meta.inspect(meta.default)
+        except Exception as e:
+            raise CMDBValueError(1302, "Invalid value")
+        if meta.default and ref_id:
+            has_ = session.query(Value).filter(
+                (Value.is_delete==False)&(Value.field_id==ref_id)&(Value.value_hash==value_hash(meta.default))).first()
+            if not has_:
+                raise CMDBValueError(1304, "Invalid value because association value does not exits")
+
+        field = _add_field(name=name, schema_id=schema_id, desc=desc, meta=meta.dumps(), ref=ref_id, unique=meta.unique)
+        projection.add_column(field)
+        try:
+            _backfill_default(field, meta)
             session.commit()
         except Exception as e:
             logger.error(e)
             session.rollback()
             field.is_delete=True
             session.commit()
+            catalog.invalidate()
             raise e
+        projection.rewrite(schema_id)
+
+
+def _backfill_default(field: Field, meta: FieldMeta):
+    """
+    新字段的默认值写入表中全部实体：值和搜索索引都以 INSERT ... SELECT 写入，需在同一事务中调用，默认值已校验
+    实体的 document 列和宽表行在提交后由 projection.rewrite 分批重写，重写完成前读取时回退到 value 表
+    """
+    now = datetime.now()
+    columns = dict(meta.shadow(meta.default), field_id=field.id, createtime=now, updatetime=now, is_delete=False,
+                   value=None if meta.default is None else str(meta.default))
+    table = Value.__table__
+    query = select([Entity.id] + [literal(item, table.c[column].type) for column, item in columns.items()]) \
+        .where((Entity.is_delete==False)&(Entity.schema_id==field.schema_id))
+    session.execute(table.insert().from_select(["entity_id"] + list(columns), query))
+    index_field(field.id, field.schema_id, meta.default)
 
 
-def delete_field(id_: int):
+def delete_field(id_: int, progress=None):
     """
-    删除字段，删除字段前查询其管理的对象
+    删除字段，删除字段前查询其管理的对象，字段的值分批批量软删除
     :param id_:
+    :param progress: 进度回调 progress(表名, 已删除行数)
     :return: None
     """
 
@@ -175,28 +255,21 @@ def delete_field(id_: int):
     if field is None:
         raise ValueError(f"Field with ID {id_} does not exist")
 
-    ref_field = session.query(Field).filter((Field.is_delete==False)&(Field.ref==id_)).first()
-    if ref_field:
+    if catalog.referencing(id_):
         raise CMDBFieldError(1106, f'Cannot delete field {field.name} because there are dependencies')
 
-    field.is_delete = True
-    query = session.query(Value).filter((Value.is_delete==False)&(Value.field_id==field.id))
-    values = itemiter(query)
-    for value in values:
-        _delete_value(value)
-    fields = session.query(Field)\
-        .filter((Field.is_delete==False)&(Field.schema_id==field.schema_id)).all()
-    if not fields:
-        entities = iter_entity(schema_id=field.schema_id)
-        for entity in entities:
-            entity.is_delete = False
     try:
+        _soft_delete(Value, Value.field_id==field.id, progress)
+        field.is_delete = True
         session.add(field)
         session.commit()
     except Exception as e:
         logger.error(e)
         session.rollback()
         raise e
+    finally:
+        catalog.invalidate()
+    projection.drop_column(field)
 
 
 def update_field(id_: int, name: str = None, desc: str = None, type: str = None, meta_: {} = None):
@@ -212,88 +285,73 @@ def update_field(id_: int, name: str = None, desc: str = None, type: str = None,
         meta.get_meta(**meta_)
     else:
         meta = src_meta
-    if name:
-        field.name = name
-    if desc:
-        field.desc = desc
-    if type:
-        field.type = type
-
     if src_meta != meta:
-        if meta.unique != src_meta.unique:
-            if src_meta.unique:
-                s = session.execute("""
-                select count(v.id) as c
-                from `value` as v
-                where v.is_delete=0 and v.field_id=:field_id
-                group by v.value
-                having count(c)>1;
-                """,{"field_id": field.id}).first()
-                if s:
-                    raise CMDBFieldError\
-                            (1107, "Unique constraint of field cannot be modified, because the value is not unique")
-            else:
-                s = session.query(Field)\
-                    .filter((field.is_delete==False)&(Field.ref==field.id)).first()
-                if s:
-                    raise CMDBFieldError\
-                        (1111, "Unique constraint of field cannot be modified, because has association field")
-        if meta.multiple != src_meta.multiple and not meta.multiple:
-            s = session.execute("""
-            select count(v.id)
-            from `value` as v
-            where v.is_delete=0 and v.field_id=:field_id
-            group by v.entity_id
-            having count(v.id)>1;
-            """, {'field_id': field.id}).first()
-            if s:
-                raise CMDBFieldError \
-                    (1108, "Multi value constraint of field cannot be modified, because the value has multiple values")
+        fieldcheck.check(field, src_meta, meta)
         if meta.relation != src_meta.relation and meta.relation:
-            target = session.query(Field).filter((Field.is_delete==False)&(Field.id==meta.relation.target)).first()
-            if target is None:
-                raise CMDBFieldError(1109, "The associated target field does not exist")
-            ref_meta = FieldMeta().loads(target.meta)
-            if ref_meta.type != src_meta.type:
-                raise CMDBFieldError(1110, "Association target field type error")
-            if not ref_meta.unique:
-                raise CMDBFieldError(1102, "Non unique field cannot be a foreign key")
-            has_conflict = session.execute("""
-            select count(source.id)
-            from `value` as source
-            left join `value` as target on source.value=target.value and target.field_id=2 and target.is_delete=0
-            where target.value is null and source.value is not null and source.field_id=3 and source.is_delete=0;
-            """).first()
-            if has_conflict[0]:
-                raise CMDBFieldError(1112, "Association target field has conflict")
             field.ref = meta.relation.target
-        if not meta.equal(src_meta):
-            query = session.query(Value).filter((Value.is_delete==False)&(Value.field_id==field.id))
-            values = itemiter(query)
-            try:
-                for value in values:
-                    meta.inspect(value.value)
-            except Exception as e:
-                # logger.error(e)
-                raise CMDBFieldError(1113, "Cannot update field meta because there is a value mismatch")
         field.meta = meta.dumps()
+        field.unique = meta.unique
+    if name:
+        field.name = name
+    if desc:
+        field.desc = desc
     try:
+        if meta.type != src_meta.type:
+            fieldcheck.reshadow(field.id, meta)
+        if meta.unique != src_meta.unique:  # 填充或清空 unique_hash，由唯一索引检查已有值是否唯一
+            session.query(Value).filter((Value.is_delete==False)&(Value.field_id==field.id)) \
+                .update({Value.unique_hash: Value.value_hash if meta.unique else None}, synchronize_session=False)
         session.add(field)
         session.commit()
+    except IntegrityError as e:
+        session.rollback()
+        raise CMDBFieldError(1107, "Unique constraint of field cannot be modified, because the value is not unique")
     except Exception as e:
         logger.error(e)
         session.rollback()
         raise e
+    finally:
+        catalog.invalidate()
+    if meta.multiple != src_meta.multiple and catalog.materialized(field.schema_id):
+        projection.rebuild(field.schema_id)
 
 
 def list_field(schema_id: object = None, field_id: object = None):
     if field_id:
-        field = session.query(Field).filter((Field.is_delete==False)&(Field.id==field_id)).first()
+        field = catalog.field(field_id)
         if field is None:
             raise ValueError(1301, f"Field with ID {field_id} does not exist")
         schema_id = field.schema_id
-    query = session.query(Field).filter((Field.is_delete==False)&(Field.schema_id==schema_id))
-    return query.all()
+    return catalog.fields(schema_id)
+
+
+def column_tree(schema_id) -> list:
+    """ 表的列目录，随字段目录一起加载 """
+    return catalog.column_tree(schema_id)
+
+
+def _fill(value: Value, meta: FieldMeta, val):
+    """ 设置值及类型化影子列，不写入数据库 """
+    value.value = None if val is None else str(val)
+    for column, item in meta.shadow(val).items():
+        setattr(value, column, item)
+    value.unique_hash = value.value_hash if meta.unique else None
+
+
+def _assign(value: Value, meta: FieldMeta, val):
+    """ 写入值，同时填充类型化影子列；唯一字段立即写入，由唯一索引检查冲突 """
+    _fill(value, meta, val)
+    if meta.unique:
+        _flush()
+    index_value(value)
+
+
+def _flush():
+    """ 写入数据库，唯一索引冲突转换为值不唯一错误 """
+    try:
+        session.flush()
+    except IntegrityError:
+        raise CMDBValueError(1303, "Invalid value because value is not unique")
 
 
 def _add_value(meta: dict, value: str, field: Field, entity: Entity):
@@ -301,52 +359,145 @@ def _add_value(meta: dict, value: str, field: Field, entity: Entity):
         meta.inspect(value)
     except Exception as e:
         raise CMDBValueError(1302, "Invalid value")
-    if meta.unique:
-        v = session.query(Value).filter(
-            (Value.is_delete == False) & (Value.field_id == field.id) & (Value.value == value)).first()
-        if v:
-            raise CMDBValueError(1303, "Invalid value because value is not unique")
+    hash_ = value_hash(value)
     if value and field.ref:
         has_ = session.query(Value)\
-            .filter((Value.is_delete==False) & (Value.field_id==field.ref)&(Value.value==value)).first()
+            .filter((Value.is_delete==False) & (Value.field_id==field.ref)&(Value.value_hash==hash_)).first()
         if not has_:
             raise CMDBValueError(1304, "Invalid value because association value does not exits")
 
-    v = Value(value=value, entity_id=entity.id, field_id=field.id)
+    v = Value(entity_id=entity.id, field_id=field.id)
     session.add(v)
+    _assign(v, meta, value)
 
 
 def add_entity(schema_id: int = None, values: dict = None):
+    """
+    添加实体：先完成全部校验，实体、值和索引一次写入、一次提交，校验失败不会留下实体
+    """
     schema = session.query(Schema).filter((Schema.is_delete==False)&(Schema.id==schema_id)).first()
     if schema is None:
         raise ValueError("The table to which the entity belongs does not exist")
     fields = list_field(schema_id)
+    values = values or {}
+
+    if validate_rows(fields, [values]):
+        raise CMDBValueError(1302, "Invalid value")
+    items = []
+    for field in fields:
+        value = values.get(field.name)
+        meta = field.fieldmeta
+        vals = value if meta.multiple and isinstance(value, list) else [value]
+        items.extend((field, val) for val in vals)
+        hashes = {value_hash(val) for val in vals if val}
+        if field.ref and hashes:
+            found = session.query(func.count(func.distinct(Value.value_hash))) \
+                .filter((Value.is_delete==False)&(Value.field_id==field.ref)&(Value.value_hash.in_(hashes))).scalar()
+            if found < len(hashes):
+                raise CMDBValueError(1304, "Invalid value because association value does not exits")
 
-    entity = Entity()
     try:
-        entity.key = uuid.uuid4().hex
-        entity.schema_id = schema_id
+        entity = Entity(key=uuid.uuid4().hex, schema_id=schema_id)
         session.add(entity)
+        for field, val in items:
+            v = Value(entity=entity, field_id=field.id)
+            _fill(v, field.fieldmeta, val)
+            index_value(v)
+        _flush()
         session.commit()
+    except Exception as e:
+        if not isinstance(e, CMDBError):
+            logger.error(e)
+        session.rollback()
+        raise e
 
-        for field in fields:
-            value = values.get(field.name)
-            meta = FieldMeta().loads(field.meta)
 
-            if meta.multiple and isinstance(value, list):
-                for val in value:
-                    _add_value(meta=meta, value=val, field=field, entity=entity)
-            else:
-                _add_value(meta=meta, value=value, field=field, entity=entity)
+def add_entities(schema_id: int, rows: list) -> list:
+    """
+    批量添加实体：整批在内存中校验，关联和唯一性每个字段各一次 IN 查询，
+    实体和值以多行 INSERT 写入并在同一事务中提交；校验不通过的行跳过，其余行照常写入
+    :param rows: [{字段名: 值}, ...]
+    :return: 出错的行 [{"row": 行序号, "errno": 错误码, "errmsg": 错误信息}, ...]
+    """
+    schema = session.query(Schema).filter((Schema.is_delete==False)&(Schema.id==schema_id)).first()
+    if schema is None:
+        raise ValueError("The table to which the entity belongs does not exist")
+    fields = list_field(schema_id)
+    errors = {index: CMDBValueError(1302, "Invalid value") for index in validate_rows(fields, rows)}
+
+    parsed = {}  # {行序号: [(field, 值, 影子列), ...]}
+    for index, row in enumerate(rows):
+        if index in errors:
+            continue
+        items = []
+        try:
+            for field in fields:
+                value = row.get(field.name)
+                meta = field.fieldmeta
+                for val in (value if meta.multiple and isinstance(value, list) else [value]):
+                    items.append((field, val, meta.shadow(val)))
+        except Exception as e:
+            errors[index] = CMDBValueError(1302, "Invalid value")
+            continue
+        parsed[index] = items
+
+    for field in fields:
+        if field.ref:
+            hashes = {shadow["value_hash"] for items in parsed.values()
+                      for f, val, shadow in items if f is field and val}
+            found = set()
+            for chunk in chunked(hashes, 1000):
+                found.update(row[0] for row in session.query(Value.value_hash).filter(
+                    (Value.is_delete==False)&(Value.field_id==field.ref)&(Value.value_hash.in_(chunk))))
+            for index, items in list(parsed.items()):
+                if any(f is field and val and shadow["value_hash"] not in found for f, val, shadow in items):
+                    errors[index] = CMDBValueError(1304, "Invalid value because association value does not exits")
+                    del parsed[index]
+        if field.fieldmeta.unique:
+            seen = {}
+            for index, items in list(parsed.items()):
+                values = [shadow["value_hash"] for f, val, shadow in items if f is field and val is not None]
+                hashes = set(values)
+                if len(hashes) != len(values) or any(hash_ in seen for hash_ in hashes):  # 行内多值重复或与前面的行重复
+                    errors[index] = CMDBValueError(1303, "Invalid value because value is not unique")
+                    del parsed[index]
+                    continue
+                seen.update((hash_, index) for hash_ in hashes)
+            for chunk in chunked(seen, 1000):
+                for row in session.query(Value.value_hash).filter(
+                        (Value.is_delete==False)&(Value.field_id==field.id)&(Value.value_hash.in_(chunk))):
+                    index = seen[row[0]]
+                    if index in parsed:
+                        errors[index] = CMDBValueError(1303, "Invalid value because value is not unique")
+                        del parsed[index]
 
+    try:
+        keys = {index: uuid.uuid4().hex for index in parsed}
+        for chunk in chunked(keys.values(), 1000):
+            session.execute(Entity.__table__.insert(), [dict(key=key, schema_id=schema_id) for key in chunk])
+        ids = {}
+        for chunk in chunked(keys.values(), 1000):
+            ids.update(session.query(Entity.key, Entity.id).filter(Entity.key.in_(chunk)))
+        values = [dict(entity_id=ids[keys[index]], field_id=field.id,
+                       value=None if val is None else str(val),
+                       unique_hash=shadow["value_hash"] if field.fieldmeta.unique else None, **shadow)
+                  for index, items in parsed.items() for field, val, shadow in items]
+        for chunk in chunked(values, 1000):
+            session.execute(Value.__table__.insert(), chunk)
+        entity_ids = list(ids.values())
+        for chunk in chunked(entity_ids, 1000):
+            index_values(session.query(Value.id, Value.value, Value.entity_id, Value.field_id)
+                         .filter((Value.entity_id.in_(chunk))&(Value.value != None)))
+        projection.touch(schema_id, entity_ids)
         session.commit()
+    except IntegrityError as e:  # 校验之后有并发写入了相同的唯一值
+        session.rollback()
+        raise CMDBValueError(1303, "Invalid value because value is not unique")
     except Exception as e:
-        if type(e) != CMDBEntityError:
-            logger.error(e)
+        logger.error(e)
         session.rollback()
-        entity.is_delete = True
-        session.commit()
         raise e
+    return [{"row": index, "errno": e.no, "errmsg": e.msg} for index, e in sorted(errors.items())]
 
 
 def update_value(meta: dict, val: str, value: Value = None, field: Field = None, id_: int = None):
@@ -355,59 +506,36 @@ def update_value(meta: dict, val: str, value: Value = None, field: Field = None,
         if value is None:
             raise CMDBValueError(1301, f"Value with ID {id_} does not exist")
 
-        field = session.query(Field).filter((Field.is_delete==False)&(Field.id==Value.field_id))
+        field = catalog.field(value.field_id)
 
     try:
         meta.inspect(val)
     except Exception as e:
         raise CMDBValueError(1302, "Invalid value")
 
-    if value and field.ref:
-        has_ = session.query(Value).filter((Value.is_delete==False)&(Value.field_id==field.ref)&(Value.value==val)).first()
+    hash_ = value_hash(val)
+    if val and field.ref:
+        has_ = session.query(Value).filter((Value.is_delete==False)&(Value.field_id==field.ref)&(Value.value_hash==hash_)).first()
         if not has_:
             raise CMDBValueError(1304, "Invalid value because association value does not exits")
 
-    if meta.unique:
-        v = session.query(Value).filter((Value.is_delete==False)&(Value.field_id==field.id)&(Value.value==val)).first()
-        if v:
-            raise CMDBValueError(1303, "Invalid value because value is not unique")
-
-        ref_fields = session.query(Field).filter((Field.is_delete == False) & (Field.ref == field.id)).all()
-
-        if ref_fields:
-            for ref_field in ref_fields:
-                meta = FieldMeta().loads(ref_field.meta)
-                if meta.relation.update_cascade == 'update':
-                    query = session.query(Value)\
-                        .filter((Value.is_delete==False)&(Value.field_id==ref_field.id)&(Value.value==v.value))
-                    ref_values = itemiter(query)
-                    for ref_value in ref_values:
-                        update_value(meta=meta, val=val, value=ref_value, field=field)
-                else:
-                    raise CMDBValueError(1305, "Cannot be updated because the value is used in other associated fields")
-
-    value.value=val
+    old_hash = value.value_hash
+    _assign(value, meta, val)
+    if meta.unique and old_hash != hash_:  # 级联更新
+        cascade = Cascade()
+        cascade.update_values(field.id, {old_hash: val})
+        cascade.apply()
 
 
-def _delete_value(value: Value):
-
-    ref_fields = session.query(Field).filter((Field.is_delete==False)&(Field.ref==value.field_id)).all()
-    if ref_fields:  # 级联处理
-        for ref_field in ref_fields:
-            meta = FieldMeta().loads(ref_field.meta)
-            if meta.relation.cascade == 'set_null':  # 级联值设置为null
-                ref_values = session.query(Value)\
-                    .filter((Value.is_delete==False)&(Value.field_id==ref_field.id)&(Value.value==value.value)).all()
-                for ref_value in ref_values:
-                    update_value(meta=meta, val=None, value=ref_value, field=ref_field)
-            elif meta.relation.cascade == 'delete':  # 级联删除
-                ref_values = session.query(Value) \
-                    .filter((Value.is_delete == False) & (Value.field_id == ref_field.id) & (Value.value == value.value)).all()
-                for ref_value in ref_values:
-                    delete_entity(ref_value.entity)
-            else:  # 没有级联值
-                raise CMDBValueError(1306, "Cannot be deleted because the value is used in other associated fields")
-    value.is_delete = True
+def _delete_values(field_id, values: list):
+    """ 删除同一字段的多个值，级联一次批量处理 """
+    for value in values:
+        value.is_delete = True
+        value.unique_hash = None
+        unindex_value(value)
+    cascade = Cascade()  # 级联处理
+    cascade.delete_values({field_id: {value.value_hash for value in values}})
+    cascade.apply()
 
 
 def delete_entity(id_: int):
@@ -415,13 +543,10 @@ def delete_entity(id_: int):
     if entity is None:
         raise ValueError(f"Entity with ID {id_} does not exist")
 
-    values = session.query(Value).filter((Value.is_delete==False)&(Value.entity_id==id_)).all()
-
     try:
-        entity.is_delete = True
-        for value in values:
-            _delete_value(value)
-
+        cascade = Cascade()
+        cascade.delete_entities([entity.id])
+        cascade.apply()
         session.commit()
     except Exception as e:
         session.rollback()
@@ -429,95 +554,47 @@ def delete_entity(id_: int):
         raise e
 
 
-def _update_value(meta: dict, value, field, entity):
-    try:
-        meta.inspect(value)
-    except Exception as e:
-        raise CMDBValueError(1302, "Invalid value")
-    if meta.unique:
-        v = session.query(Value).filter(
-            (Value.is_delete == False) & (Value.field_id == field.id) & (Value.value == value)).first()
-        if v:
-            raise CMDBValueError(1303, "Invalid value because value is not unique")
-
-        # 级联更新
-        ref_fields = session.query(Field).filter((Field.is_delete == False) & (Field.ref == field.id)).all()
-
-        if ref_fields:
-            for ref_field in ref_fields:
-                meta = FieldMeta().loads(ref_field.meta)
-                if meta.relation.update_cascade == 'update':
-                    ref_values = session.query(Value) \
-                        .filter(
-                        (Value.is_delete == False) & (Value.field_id == ref_field.id) & (Value.value == v.value)).all()
-                    for ref_value in ref_values:
-                        update_value(meta=meta, val=value.value, value=ref_value, field=field)
-                else:
-                    raise CMDBValueError(1305, "Cannot be updated because the value is used in other associated fields")
-
-    if value and field.ref:
-        has_ = session.query(Value).filter(
-            (Value.is_delete == False) & (Value.field_id == field.ref) & (Value.value == value)).first()
-        if not has_:
-            raise CMDBValueError(1304, "Invalid value because association value does not exits")
-
-    v = session.query(Value) \
-        .filter((Value.is_delete == False) & (Value.entity_id == entity.id) & (Value.field_id == field.id)).first()
-
-    if v is None:
-        raise CMDBValueError(1301, "Value does not exist")
-
-    v.value = value
-
-
-def _update_multiple_value(meta: dict, values: list, field, entity):
-
-    vs = session.query(Value) \
-        .filter((Value.is_delete == False) & (Value.entity_id == entity.id) & (Value.field_id == field.id)).all()
-
-    if not vs:
-        raise CMDBValueError(1301, "Values does not exist")
-
-    values_len = len(values)
-    vs_len = len(vs)
-
-    if values_len == vs_len:  # 情况1：修改值的数量和原有值数量一样多
-        for i in range(vs_len):
-            v = vs[i]
-            update_value(meta=meta, val=values[i], value=v, field=field)
-
-    elif values_len > vs_len:  # 情况2： 修改值的数量比原有值数量多
-        for i in range(vs_len):
-            v = vs[i]
-            update_value(meta=meta, val=values[i], value=v, field=field)
-        for i in range(vs_len, values_len):
-            _add_value(meta=meta, value=values[i], entity=entity, field=field)
-    else:  # 情况3：修改值数量比原有值数量少
-        for i in range(values_len):
-            v = vs[i]
-            update_value(meta=meta, val=values[i], value=v, field=field)
-        for i in range(values_len, vs_len):
-            v = vs[i]
-            _delete_value(v)
+def _update_values(meta: FieldMeta, values: list, field, entity, current: list):
+    """
+    按字符串形式对比字段的新旧值，只写入变化的部分：未变化的值不校验也不触发级联，
+    变化的值优先复用旧值行更新，多出的新值插入，多余的旧值一次批量删除
+    :param current: 实体该字段当前的值
+    """
+    remaining = {}
+    for v in current:
+        remaining.setdefault(v.value, []).append(v)
+    added = []
+    for val in values:
+        same = remaining.get(None if val is None else str(val))
+        if same:
+            same.pop()
+        else:
+            added.append(val)
+    stale = [v for vs in remaining.values() for v in vs]
+
+    for v, val in zip(stale, added):
+        update_value(meta=meta, val=val, value=v, field=field)
+    for val in added[len(stale):]:
+        _add_value(meta=meta, value=val, entity=entity, field=field)
+    if len(stale) > len(added):
+        _delete_values(field.id, stale[len(added):])
 
 
 def update_entity(id_: int, **kwargs):
     entity = session.query(Entity).filter((Entity.is_delete==False)&(Entity.id==id_)).first()
     if entity is None:
         raise ValueError(f"Entity with ID {id_} does not exist")
-    fields = session.query(Field).filter((Field.is_delete==False) & (Field.schema_id==entity.schema_id)).all()
+    fields = list_field(entity.schema_id)
 
+    fields = [field for field in fields if kwargs.get(field.name)]
+    current = _load_values([entity.id], fields)
     try:
         for field in fields:
             value = kwargs.get(field.name)
-            if not value:
-                continue
-            meta = FieldMeta().loads(field.meta)
-
-            if meta.multiple and isinstance(value, list):
-                _update_multiple_value(meta=meta, values=value, field=field, entity=entity)
-            else:
-                _update_value(meta=meta, value=value, field=field, entity=entity)
+            meta = field.fieldmeta
+            values = value if meta.multiple and isinstance(value, list) else [value]
+            _update_values(meta=meta, values=values, field=field, entity=entity,
+                           current=current.get((entity.id, field.id), []))
         session.commit()
     except Exception as e:
         if type(e) != CMDBEntityError:
@@ -527,123 +604,199 @@ def update_entity(id_: int, **kwargs):
 
 
 def iter_entity(schema_id: int, query=None, fields=None):
-    cond = (Entity.is_delete==False)&(Entity.schema_id==schema_id)
-    if query and fields:
-        for field in fields:
-            cond_val = query.get(field.name)
-            if cond_val:
-                cond &= (Value.field_id == field.id) & (Value.value.like(f'%{cond_val}%'))
-        query = session.query(Entity) \
-            .join(Value, (Value.entity_id == Entity.id) & (Entity.schema_id == schema_id)).filter(cond)
-    else:
-        query = session.query(Entity).filter(cond)
-    return itemiter(query)
+    return itemiter(plan(schema_id, query, fields))
 
 
-def list_entity(schema_id: int, page: int, size: int, query: dict = None, fields: list = None):
-    cond = (Entity.is_delete==False) & (Entity.schema_id==schema_id)
-    if query and fields:
-        for field in fields:
-            cond_val = query.get(field.name)
-            if cond_val:
-                cond &= (Value.field_id==field.id)&(Value.value.like(f'%{cond_val}%'))
-        query = session.query(Entity)\
-            .join(Value, (Value.entity_id == Entity.id) & (Entity.schema_id == schema_id)).filter(cond)
-    else:
-        query = session.query(Entity).filter(cond)
-    return pagination(size=size, page=page, query=query)
+def list_entity(schema_id: int, page: int, size: int, query: dict = None, fields: list = None,
+                cursor: str = None, count: str = "exact"):
+    query = plan(schema_id, query, fields)
+    return pagination(size=size, page=page, query=query, cursor=cursor, count=count)
 
 
-def get_entity(fields, id_, name, val) -> {}:
-    value = session.query(Value) \
-        .filter((Value.is_delete==False)&(Value.value==val)&(Value.field_id==id_)).first()
-    entity = session.query(Entity) \
-        .filter((Entity.is_delete==False)&(Entity.id==value.entity_id)).first()
-    record = {}
+def _load_values(entity_ids: list, fields: list) -> dict:
+    """
+    批量加载一页实体的值，按 (entity_id, field_id) 分组
+    :param entity_ids: 实体ID列表
+    :param fields: 字段列表
+    :return: {(entity_id, field_id): [Value, ...]}
+    """
+    field_ids = [field.id for field in fields]
+    grouped = {}
+    if not entity_ids or not field_ids:
+        return grouped
+    for ids in chunked(entity_ids, 500):
+        values = session.query(Value) \
+            .filter((Value.is_delete == False) & (Value.entity_id.in_(ids)) & (Value.field_id.in_(field_ids))) \
+            .order_by(Value.id)
+        for value in values:
+            grouped.setdefault((value.entity_id, value.field_id), []).append(value)
+    return grouped
 
-    for field in fields:
-        if field.id != id_:
-            if entity:
-                meta = FieldMeta().loads(field.meta)
-                values = session.query(Value) \
-                    .filter((Value.is_delete==False)&(Value.entity_id==entity.id)&(Value.field_id==field.id))
-                if meta.multiple:
-                    value = [val.value for val in values.all()]
-                else:
-                    value = values.first().value
-            else:
-                value = ""
-            record.update({f"{name}{field.name}": value})
-     
-    return record
+
+def _load_documents(entities: list, fields: list) -> dict:
+    """
+    优先从实体的 document 列组装值，没有文档或文档缺少字段（文档生成后新增的字段）的实体再批量查询 value 表
+    :return: 同 _load_values
+    """
+    grouped = {}
+    missing = []
+    for entity in entities:
+        document = json.loads(entity.document) if entity.document else None
+        if document is None or any(str(field.id) not in document for field in fields):
+            missing.append(entity.id)
+            continue
+        for field in fields:
+            items = document.get(str(field.id))
+            if not items:
+                continue
+            if isinstance(items, dict):
+                items = [items]
+            grouped[(entity.id, field.id)] = [
+                Value(id=item["id"], value=item["value"], value_hash=value_hash(item["value"]),
+                      entity_id=entity.id, field_id=field.id) for item in items]
+    grouped.update(_load_values(missing, fields))
+    return grouped
 
 
 def _format_record(entities: list, fields: list) -> list:
     records = []
+    grouped = _load_documents(entities, fields)
     for entity in entities:
         record = entity.todict()
         for field in fields:
-            meta = FieldMeta().loads(field.meta)
-            values = session.query(Value) \
-                .filter((Value.is_delete == False) & (Value.entity_id == entity.id) & (Value.field_id == field.id))
-            if meta.multiple:
-                value = [val.todict() for val in values.all()]
+            values = grouped.get((entity.id, field.id), [])
+            if field.fieldmeta.multiple:
+                value = [val.todict() for val in values]
             else:
-                value = values.first().todict()
+                value = values[0].todict() if values else None
             record.update({field.name: value})
         records.append(record)
     return records
 
 
-def list_record(schema_id: int, query_fields: list = None, page: int = None, size: int = None, query: dict = None) -> tuple:
+def list_record(schema_id: int, query_fields: list = None, page: int = None, size: int = None, query: dict = None,
+                cursor: str = None, count: str = "exact") -> tuple:
+    key = ("list_record", int(schema_id), tuple(query_fields or ()), page, size,
+           json.dumps(query, sort_keys=True, default=str), cursor, count)
+    return cache.read_through(
+        key, [schema_id], lambda: _list_record(schema_id, query_fields, page, size, query, cursor, count))
+
+
+def _list_record(schema_id, query_fields, page, size, query, cursor, count) -> tuple:
     fields = list_field(schema_id)
-    entities, pagination = list_entity(schema_id, page, size, query=query, fields=fields)
+    entities, pagination = list_entity(schema_id, page, size, query=query, fields=fields, cursor=cursor, count=count)
     if not entities or not fields:
         return [], pagination
     if query_fields:
         fields = tuple(filter(lambda x: x.name in query_fields, fields))
 
-    records = _format_record(entities, fields)
+    if catalog.materialized(schema_id):
+        records = projection.records(schema_id, entities, fields, _format_record)
+    else:
+        records = _format_record(entities, fields)
     return records, pagination
 
 
-def list_relation_record(schema_id: int, query_fields: list = None, page: int = None, size: int = None, query: dict = None) -> tuple:
+def _relation_targets(fields: list) -> dict:
+    """
+    查询关联字段所指向的目标表的全部字段
+    :param fields: 字段列表
+    :return: {field_id: (field, target_fields)}
+    """
+    ref_fields = {}
+    for field in fields:
+        target = catalog.field(field.ref) if field.ref else None
+        if target:
+            ref_fields[field.id] = (field, catalog.fields(target.schema_id))
+    return ref_fields
+
+
+def _resolve_relations(entity_ids: list, ref_fields: dict, grouped: dict) -> tuple:
+    """
+    批量解析一批实体的关联值，按关联字段收集引用值后一次查出目标实体及其字段值
+    :param entity_ids: 实体ID列表
+    :param ref_fields: _relation_targets 的返回值
+    :param grouped: _load_values 的返回值，需包含关联字段的值
+    :return: ({(entity_id, field_id): target_entity_id}, {(target_entity_id, field_id): [Value, ...]})
+    """
+    matches = {}
+    targets = {}
+    for field_id, (field, target_fields) in ref_fields.items():
+        refs = {}
+        for entity_id in entity_ids:
+            values = grouped.get((entity_id, field_id))
+            if values and values[0].value_hash is not None:
+                refs[entity_id] = values[0].value_hash
+        if not refs or not target_fields:
+            continue
+        hits = {}
+        for hashes in chunked(set(refs.values()), 500):
+            query = session.query(Value.value_hash, Value.entity_id) \
+                .join(Entity, Entity.id == Value.entity_id) \
+                .filter((Value.is_delete==False)&(Entity.is_delete==False)
+                        &(Value.field_id==field.ref)&(Value.value_hash.in_(hashes)))
+            for hash_, entity_id in query:
+                hits.setdefault(hash_, entity_id)
+        schema_id = target_fields[0].schema_id
+        for entity_id, value in refs.items():
+            target_id = hits.get(value)
+            if target_id:
+                matches[(entity_id, field_id)] = target_id
+                targets.setdefault(schema_id, (target_fields, set()))[1].add(target_id)
+
+    target_grouped = {}
+    for target_fields, ids in targets.values():
+        target_grouped.update(_load_values(list(ids), target_fields))
+    return matches, target_grouped
+
+
+def list_relation_record(schema_id: int, query_fields: list = None, page: int = None, size: int = None, query: dict = None,
+                         cursor: str = None, count: str = "exact") -> tuple:
+    key = ("list_relation_record", int(schema_id), tuple(query_fields or ()), page, size,
+           json.dumps(query, sort_keys=True, default=str), cursor, count)
+    schema_ids = [schema_id] + [catalog.field(field.ref).schema_id
+                                for field in list_field(schema_id) if catalog.field(field.ref)]
+    return cache.read_through(
+        key, schema_ids, lambda: _list_relation_record(schema_id, query_fields, page, size, query, cursor, count))
+
+
+def _list_relation_record(schema_id, query_fields, page, size, query, cursor, count) -> tuple:
     fields = list_field(schema_id=schema_id)
-    entities, pagination = list_entity(schema_id, page, size, query=query, fields=fields)
+    entities, pagination = list_entity(schema_id, page, size, query=query, fields=fields, cursor=cursor, count=count)
     if not entities or not fields:
         return [], pagination
     if query_fields:
         fields = tuple(filter(lambda x: x.name in query_fields, fields))
 
-    records = []
-    ref_fields = {}
-    for ref_field in filter(lambda x: x.ref, fields):
-        temp = session.query(Field).filter((Field.is_delete==False)&(Field.id==ref_field.ref)).first()
-        _fields = list_field(schema_id=temp.schema_id)
-        ref_fields[ref_field.id] = _fields
+    entity_ids = [entity.id for entity in entities]
+    ref_fields = _relation_targets(fields)
+    grouped = _load_documents(entities, fields)
+    matches, target_grouped = _resolve_relations(entity_ids, ref_fields, grouped)
 
+    records = []
     for entity in entities:
         record = entity.todict()
-        ref_values = {}
         for field in fields:
-            meta = FieldMeta().loads(field.meta)
-            values = session.query(Value) \
-                .filter((Value.is_delete==False) & (Value.entity_id==entity.id)&(Value.field_id==field.id))
-            if meta.multiple:
-                values = values.all()
-                if field.ref:
-                    ref_values[field.id] = [field.ref, field.name, val[0].value]
+            values = grouped.get((entity.id, field.id), [])
+            if field.fieldmeta.multiple:
                 value = [val.value for val in values]
             else:
-                value = values.first()
-                if field.ref:
-                    ref_values[field.id] = [field.ref, field.name, value.value]
-                value = value.value
+                value = values[0].value if values else None
             record.update({field.name: value})
-        for id_, value in ref_values.items():
-            ref, name, val = value
-            _fields = ref_fields.get(id_)
-            record.update(get_entity(_fields, ref, name, val))
+        for id_, (ref_field, target_fields) in ref_fields.items():
+            target_id = matches.get((entity.id, id_))
+            for field in target_fields:
+                if field.id == ref_field.ref:
+                    continue
+                if target_id:
+                    values = target_grouped.get((target_id, field.id), [])
+                    if field.fieldmeta.multiple:
+                        value = [val.value for val in values]
+                    else:
+                        value = values[0].value if values else None
+                else:
+                    value = ""
+                record.update({f"{ref_field.name}{field.name}": value})
         records.append(record)
     return records, pagination
 
@@ -654,89 +807,82 @@ def iter_record(schema_id: int, query: dict = None, query_fields: list = None):
     if query_fields:
         fields = tuple(filter(lambda x: x.name in query_fields, fields))
     yield [field.name for field in fields]
-    for entity in entities:
-        row = []
-        for field in fields:
-            meta = FieldMeta().loads(field.meta)
-            values = session.query(Value) \
-                .filter((Value.is_delete==False)&(Value.entity_id==entity.id)&(Value.field_id==field.id))
-            if meta.multiple:
-                value = [val.value for val in values.all()]
-            else:
-                value = values.first().value
-            row.append(value)
-        yield row
-
-
-def get_relation_entity(fields, id_, name, val, query_fields) -> {}:
-    value = session.query(Value) \
-        .filter((Value.is_delete==False)&(Value.value==val)&(Value.field_id==id_)).first()
-    if value:
-        entity = session.query(Entity) \
-            .filter((Entity.is_delete==False)&(Entity.id==value.entity_id)).first()
-    else:
-        entity = None
-    record = []
-
-    for field in fields:
-        if field.id != id_ and (name+field.name) in query_fields:
-            if entity:
-                meta = FieldMeta().loads(field.meta)
-                values = session.query(Value) \
-                    .filter((Value.is_delete==False)&(Value.entity_id==entity.id)&(Value.field_id==field.id))
-                if meta.multiple:
-                    value = ",".join([val.value for val in values.all()])
+    materialized = catalog.materialized(schema_id)
+    for chunk in chunked(entities, 100):
+        if materialized:
+            for record in projection.records(schema_id, chunk, fields, _format_record):
+                row = []
+                for field in fields:
+                    value = record[field.name]
+                    if field.fieldmeta.multiple:
+                        row.append([val["value"] for val in value or []])
+                    else:
+                        row.append(value["value"] if value else None)
+                yield row
+            continue
+        grouped = _load_documents(chunk, fields)
+        for entity in chunk:
+            row = []
+            for field in fields:
+                values = grouped.get((entity.id, field.id), [])
+                if field.fieldmeta.multiple:
+                    value = [val.value for val in values]
                 else:
-                    value = values.first().value
-            else:
-                value = ""
-            record.append(value)
-    return record
+                    value = values[0].value if values else None
+                row.append(value)
+            yield row
 
 
 def iter_relation_record(schema_id: int, query: dict = None, query_fields: list = None):
     fields = list_field(schema_id)
     entities = iter_entity(schema_id, query=query, fields=fields)
 
-    ref_fields = {}
-    for ref_field in filter(lambda x: x.ref, fields):
-        temp = session.query(Field).filter((Field.is_delete==False)&(Field.id==ref_field.ref)).first()
-        _fields = list_field(schema_id=temp.schema_id)
-        ref_fields[ref_field.id] = (ref_field.name, ref_field.ref, _fields)
+    ref_fields = _relation_targets(fields)
+    load_fields = list(fields)
     if query_fields:
         fields = tuple(filter(lambda x: x.name in query_fields, fields))
         yield query_fields
     else:
         yield [field.name for field in fields]
-    for entity in entities:
-        row = []
-        ref_values = {}
-        for field in fields:
-            meta = FieldMeta().loads(field.meta)
-            values = session.query(Value) \
-                .filter((Value.is_delete==False)&(Value.entity_id==entity.id)&(Value.field_id==field.id))
-            if meta.multiple:
-                value = [val.value for val in values.all()]
-                if field.ref:
-                    ref_values[field.id] = value[0]
-                value = ",".join(value)
-            else:
-                value = values.first().value
-                if field.ref:
-                    ref_values[field.id] = value
-            row.append(value)
-
-        for id_, value in ref_fields.items():
-            name, ref, fields = value
-            val = ref_values.get(id_)
-            row.extend(get_relation_entity(fields, ref, name, val, query_fields))
-
-        yield row
-
-
-def list_value(id_: int, page: int, size: int):
+    relation_columns = [
+        (id_, ref_field, [field for field in target_fields
+                          if field.id != ref_field.ref and (ref_field.name+field.name) in (query_fields or ())])
+        for id_, (ref_field, target_fields) in ref_fields.items()
+    ]
+
+    for chunk in chunked(entities, 100):
+        entity_ids = [entity.id for entity in chunk]
+        grouped = _load_documents(chunk, load_fields)
+        matches, target_grouped = _resolve_relations(entity_ids, ref_fields, grouped)
+        for entity in chunk:
+            row = []
+            for field in fields:
+                values = grouped.get((entity.id, field.id), [])
+                if field.fieldmeta.multiple:
+                    value = ",".join([val.value for val in values])
+                else:
+                    value = values[0].value if values else None
+                row.append(value)
+
+            for id_, ref_field, target_fields in relation_columns:
+                target_id = matches.get((entity.id, id_))
+                for field in target_fields:
+                    if target_id:
+                        values = target_grouped.get((target_id, field.id), [])
+                        if field.fieldmeta.multiple:
+                            value = ",".join([val.value for val in values])
+                        else:
+                            value = values[0].value if values else None
+                    else:
+                        value = ""
+                    row.append(value)
+
+            yield row
+
+
+def list_value(id_: int, page: int, size: int, cursor: str = None, count: str = "exact"):
     query = session.query(Value).filter((Value.is_delete==False)&(Value.field_id==id_))
-    return pagination(size=size, page=page, query=query)
+    return pagination(size=size, page=page, query=query, cursor=cursor, count=count)
 
 
 def iter_value(id_: int):
@@ -0,0 +1,99 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from cmdb.models import Session
+from cmdb.catalog import catalog
+from settings import RESULT_CACHE_ENTRIES, RESULT_CACHE_BYTES, RESULT_CACHE_TTL
+
+
+class ResultCache:
+    """
+    LRU + TTL 结果缓存，按条目数和结果序列化后的字节数限制容量。
+    键中带有相关表的代数，表数据变更后代数递增，旧条目不再命中并随 LRU 淘汰。
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=64*1024*1024, ttl=60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                self.misses += 1
+                if item is not None:
+                    self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[2]
+
+    def set(self, key, value):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self.bytes += size
+            while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+                self._pop(next(iter(self._data)))
+                self.evictions += 1
+
+    def _pop(self, key):
+        _, size, _ = self._data.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        return dict(entries=len(self._data), bytes=self.bytes, hits=self.hits,
+                    misses=self.misses, evictions=self.evictions)
+
+
+results = ResultCache(RESULT_CACHE_ENTRIES, RESULT_CACHE_BYTES, RESULT_CACHE_TTL)
+_generations = {}
+
+
+def bump(*schema_ids):
+    """ 表数据变更，递增表的代数 """
+    for schema_id in schema_ids:
+        schema_id = int(schema_id)
+        _generations[schema_id] = _generations.get(schema_id, 0) + 1
+
+
+def generation(schema_id) -> int:
+    return _generations.get(int(schema_id), 0)
+
+
+def read_through(key: tuple, schema_ids, loader):
+    """
+    读取缓存，未命中时调用 loader 并写入
+    :param key: 查询参数
+    :param schema_ids: 结果依赖的表
+    :param loader: 无参函数
+    """
+    key = key + (catalog.version,) + tuple(generation(schema_id) for schema_id in schema_ids)
+    value = results.get(key)
+    if value is None:
+        value = loader()
+        results.set(key, value)
+    return value
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed(session_):
+    bump(*session_.info.pop("committed", ()))
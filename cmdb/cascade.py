@@ -0,0 +1,142 @@
+from sqlalchemy.exc import IntegrityError
+from cmdb.models import session, Entity, Value, Token
+from cmdb.catalog import catalog
+from cmdb.search import index_values
+from cmdb.exceptions import CMDBValueError
+from cmdb.tools import chunked
+from cmdb import projection
+
+
+class Cascade:
+    """
+    级联计划：从被删除的实体、值以及被修改的唯一值出发，逐层按 (字段, value_hash) 批量查询引用它们的值，
+    求出全部需要删除的实体和需要更新（含置空）的引用值，最后以少量批量 UPDATE 在当前事务中写入。
+    已展开过的 (字段, 值) 不再展开，关联关系成环时也能终止
+    """
+
+    def __init__(self):
+        self.entities = {}  # 需删除的实体 {entity_id: schema_id}
+        self.updates = {}  # 需更新的引用值 {field_id: {原 value_hash: 新值}}
+        self.values = {}  # 需更新的引用值行 {field_id: [(value_id, entity_id, 原 value_hash)]}
+        self._deleted = set()
+        self._updated = set()
+
+    def delete_entities(self, entity_ids):
+        """ 删除实体及其全部值 """
+        ids = set()
+        for chunk in chunked(entity_ids, 1000):
+            query = session.query(Entity.id, Entity.schema_id).filter((Entity.is_delete==False)&(Entity.id.in_(chunk)))
+            for id_, schema_id in query:
+                self.entities[id_] = schema_id
+                ids.add(id_)
+        self._expand(self._entity_values(ids), {})
+
+    def delete_values(self, values: dict):
+        """ 删除值，values: {field_id: {value_hash}}，值本身由调用方标记删除 """
+        self._expand(values, {})
+
+    def update_values(self, field_id, changes: dict):
+        """ 修改唯一字段的值，changes: {原 value_hash: 新值}，值本身由调用方写入 """
+        self._expand({}, {field_id: changes})
+
+    def _entity_values(self, entity_ids) -> dict:
+        values = {}
+        for chunk in chunked(entity_ids, 1000):
+            query = session.query(Value.field_id, Value.value_hash) \
+                .filter((Value.is_delete==False)&(Value.entity_id.in_(chunk))&(Value.value_hash != None))
+            for field_id, hash_ in query:
+                values.setdefault(field_id, set()).add(hash_)
+        return values
+
+    def _referencing(self, ref_field, hashes) -> list:
+        rows = []
+        for chunk in chunked(hashes, 1000):
+            query = session.query(Value.id, Value.entity_id, Value.value_hash) \
+                .filter((Value.is_delete==False)&(Value.field_id==ref_field.id)&(Value.value_hash.in_(chunk)))
+            rows.extend(row for row in query if row[1] not in self.entities)
+        return rows
+
+    def _set(self, ref_field, rows, changes: dict):
+        meta = ref_field.fieldmeta
+        for val in set(changes.values()):
+            try:
+                meta.inspect(val)
+            except Exception as e:
+                raise CMDBValueError(1302, "Invalid value")
+        self.updates.setdefault(ref_field.id, {}).update(changes)
+        self.values.setdefault(ref_field.id, []).extend(rows)
+
+    def _expand(self, deleted: dict, updated: dict):
+        while deleted or updated:
+            next_deleted, next_updated = {}, {}
+            for field_id, hashes in deleted.items():
+                hashes = {hash_ for hash_ in hashes if hash_ is not None and (field_id, hash_) not in self._deleted}
+                self._deleted.update((field_id, hash_) for hash_ in hashes)
+                for ref_field in catalog.referencing(field_id) if hashes else ():
+                    rows = self._referencing(ref_field, hashes)
+                    if not rows:
+                        continue
+                    cascade = ref_field.fieldmeta.relation.cascade
+                    if cascade == 'set_null':  # 级联值设置为null
+                        changes = {hash_: None for _, _, hash_ in rows}
+                        self._set(ref_field, rows, changes)
+                        next_updated.setdefault(ref_field.id, {}).update(changes)
+                    elif cascade == 'delete':  # 级联删除
+                        ids = {entity_id for _, entity_id, _ in rows}
+                        self.entities.update((id_, ref_field.schema_id) for id_ in ids)
+                        for ref_id, ref_hashes in self._entity_values(ids).items():
+                            next_deleted.setdefault(ref_id, set()).update(ref_hashes)
+                    else:
+                        raise CMDBValueError(1306, "Cannot be deleted because the value is used in other associated fields")
+            for field_id, changes in updated.items():
+                changes = {hash_: val for hash_, val in changes.items()
+                           if hash_ is not None and (field_id, hash_) not in self._updated}
+                self._updated.update((field_id, hash_) for hash_ in changes)
+                for ref_field in catalog.referencing(field_id) if changes else ():
+                    rows = self._referencing(ref_field, changes)
+                    if not rows:
+                        continue
+                    if ref_field.fieldmeta.relation.update_cascade != 'update':
+                        raise CMDBValueError(1305, "Cannot be updated because the value is used in other associated fields")
+                    ref_changes = {hash_: changes[hash_] for _, _, hash_ in rows}
+                    self._set(ref_field, rows, ref_changes)
+                    next_updated.setdefault(ref_field.id, {}).update(ref_changes)
+            deleted, updated = next_deleted, next_updated
+
+    def apply(self):
+        """ 在当前事务中写入级联结果 """
+        try:
+            for chunk in chunked(list(self.entities), 1000):
+                session.query(Entity).filter(Entity.id.in_(chunk)) \
+                    .update({Entity.is_delete: True}, synchronize_session=False)
+                session.query(Value).filter((Value.is_delete==False)&(Value.entity_id.in_(chunk))) \
+                    .update({Value.is_delete: True, Value.unique_hash: None}, synchronize_session=False)
+                session.query(Token).filter(Token.entity_id.in_(chunk)).delete(synchronize_session=False)
+            touched = {}
+            for entity_id, schema_id in self.entities.items():
+                touched.setdefault(schema_id, set()).add(entity_id)
+
+            for field_id, changes in self.updates.items():
+                field = catalog.field(field_id)
+                meta = field.fieldmeta
+                rows = [row for row in self.values[field_id] if row[1] not in self.entities]
+                grouped = {}
+                for hash_, val in changes.items():
+                    grouped.setdefault(val, set()).add(hash_)
+                for val, hashes in grouped.items():
+                    shadow = meta.shadow(val)
+                    columns = dict(shadow, value=None if val is None else str(val),
+                                   unique_hash=shadow["value_hash"] if meta.unique else None)
+                    targets = [(id_, entity_id) for id_, entity_id, hash_ in rows if hash_ in hashes]
+                    for chunk in chunked(targets, 1000):
+                        ids = [id_ for id_, _ in chunk]
+                        session.query(Value).filter(Value.id.in_(ids)).update(columns, synchronize_session=False)
+                        session.query(Token).filter(Token.value_id.in_(ids)).delete(synchronize_session=False)
+                        if val is not None:
+                            index_values([(id_, val, entity_id, field_id) for id_, entity_id in chunk])
+                    touched.setdefault(field.schema_id, set()).update(entity_id for _, entity_id in targets)
+
+            for schema_id, entity_ids in touched.items():
+                projection.touch(schema_id, entity_ids)
+        except IntegrityError as e:
+            raise CMDBValueError(1303, "Invalid value because value is not unique")
@@ -0,0 +1,155 @@
+import json
+import hashlib
+import threading
+from cmdb.models import Session, Schema, Field
+from cmdb.tools import FieldMeta
+
+
+class CachedField:
+    """ Field 行的只读快照，fieldmeta 为解析好的元属性 """
+    __slots__ = ("id", "name", "desc", "meta", "ref", "schema_id", "createtime", "updatetime", "fieldmeta")
+
+    def __init__(self, field: Field):
+        self.id = field.id
+        self.name = field.name
+        self.desc = field.desc
+        self.meta = field.meta
+        self.ref = field.ref
+        self.schema_id = field.schema_id
+        self.createtime = field.createtime
+        self.updatetime = field.updatetime
+        self.fieldmeta = FieldMeta().loads(field.meta)
+
+
+class Catalog:
+    """
+    进程内字段目录缓存：按表缓存字段、关联关系、唯一字段、启用宽表投影的表，
+    以及由它们派生的关联目录和列目录。
+    字段或表变更后调用 invalidate 递增版本号，下次读取时整体重新加载，派生视图随之重建。
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._loaded = None
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._by_schema = {}
+        self._by_ref = {}
+        self._materialized = set()
+        self._relations = ([], None)
+        self._column_trees = {}
+        self._derived = {}
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def _load(self):
+        if self._loaded == self.version:
+            return
+        with self._lock:
+            if self._loaded == self.version:
+                return
+            version = self.version
+            by_id, by_schema, by_ref = {}, {}, {}
+            # 使用独立的会话和事务读取，不受调用线程会话中旧快照或未提交写入的影响
+            db = Session()
+            try:
+                query = db.query(Field).filter(Field.is_delete==False).order_by(Field.id)
+                for field in query:
+                    field = CachedField(field)
+                    by_id[field.id] = field
+                    by_schema.setdefault(field.schema_id, []).append(field)
+                    if field.ref:
+                        by_ref.setdefault(field.ref, []).append(field)
+                schemas = db.query(Schema.id, Schema.name, Schema.materialized) \
+                    .filter(Schema.is_delete==False).order_by(Schema.id).all()
+            finally:
+                db.close()
+            self._materialized = {id_ for id_, _, materialized in schemas if materialized}
+            self._relations = self._build_relations(schemas, by_schema)
+            self._column_trees = {id_: self._build_column_tree(id_, by_id, by_schema) for id_, _, _ in schemas}
+            self._by_id, self._by_schema, self._by_ref = by_id, by_schema, by_ref
+            self._derived = {}
+            self._loaded = version
+
+    @staticmethod
+    def _build_relations(schemas, by_schema) -> tuple:
+        data = []
+        for schema_id, schema_name, _ in schemas:
+            children = [{"value": field.id, "label": field.name}
+                        for field in by_schema.get(schema_id, ()) if field.fieldmeta.unique]
+            data.append({"value": schema_id, "label": schema_name, "children": children, "disabled": not children})
+        etag = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        return data, etag
+
+    @staticmethod
+    def _build_column_tree(schema_id, by_id, by_schema) -> list:
+        fields = by_schema.get(schema_id, [])
+        columns = [{
+            "key": field.id,
+            "title": field.name,
+            "ref": field.ref,
+            "meta": json.loads(field.meta),
+            "description": field.desc,
+        } for field in fields]
+        for field in fields:
+            target = by_id.get(field.ref) if field.ref else None
+            if target is None:
+                continue
+            columns.extend([{
+                "key": f'{field.id}-{f.id}',
+                "title": f'{field.name}{f.name}',
+                "meta": json.loads(f.meta),
+                "description": f.desc
+            } for f in by_schema.get(target.schema_id, ()) if f.id != target.id])
+        return columns
+
+    def fields(self, schema_id) -> list:
+        if schema_id is None:
+            return []
+        self._load()
+        return list(self._by_schema.get(int(schema_id), ()))
+
+    def field(self, field_id):
+        if field_id is None:
+            return None
+        self._load()
+        return self._by_id.get(int(field_id))
+
+    def referencing(self, field_id) -> list:
+        """ 关联到 field_id 的字段 """
+        self._load()
+        return list(self._by_ref.get(int(field_id), ()))
+
+    def unique_fields(self, schema_id) -> list:
+        return [field for field in self.fields(schema_id) if field.fieldmeta.unique]
+
+    def relations(self) -> tuple:
+        """ 表 -> 唯一字段 的关联目录 (data, etag) """
+        self._load()
+        return self._relations
+
+    def column_tree(self, schema_id) -> list:
+        """ 表的列目录：本表字段在前，随后是关联字段展开的目标表字段（只展开一层，不含关联目标字段本身） """
+        if schema_id is None:
+            return []
+        self._load()
+        return self._column_trees.get(int(schema_id), [])
+
+    def derived(self, key, factory):
+        """ 其他模块基于目录派生的对象（如宽表的 Table 定义），与目录一起失效 """
+        self._load()
+        derived = self._derived
+        if key not in derived:
+            derived[key] = factory()
+        return derived[key]
+
+    def materialized(self, schema_id) -> bool:
+        if schema_id is None:
+            return False
+        self._load()
+        return int(schema_id) in self._materialized
+
+
+catalog = Catalog()
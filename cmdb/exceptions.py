@@ -1,9 +1,10 @@
 class CMDBError(Exception):
     """CMDB Base Error"""
 
-    def __init__(self, no, msg):
+    def __init__(self, no, msg, data=None):
         self.no = no
         self.msg = msg
+        self.data = data  # 附带的出错数据，如不满足条件的值的样例
 
     def __str__(self):
         return self.msg
@@ -13,9 +14,10 @@ class CMDBError(Exception):
 class CMDBSchemaError(CMDBError):
     """ this is cmdb's Exception for check the schema """
 
-    def __init__(self, no, msg):  # real signature unknown
+    def __init__(self, no, msg, data=None):  # real signature unknown
         self.no = no
         self.msg = msg
+        self.data = data
 
     def __str__(self):
         return self.msg
@@ -24,9 +26,10 @@ class CMDBSchemaError(CMDBError):
 class CMDBFieldError(CMDBError):
     """ this is cmdb's Exception for check the field """
 
-    def __init__(self, no, msg):  # real signature unknown
+    def __init__(self, no, msg, data=None):  # real signature unknown
         self.no = no
         self.msg = msg
+        self.data = data
 
     def __str__(self):
         return self.msg
@@ -35,9 +38,10 @@ class CMDBFieldError(CMDBError):
 class CMDBEntityError(CMDBError):
     """ this is cmdb's Exception for check the entity """
 
-    def __init__(self, no, msg):  # real signature unknown
+    def __init__(self, no, msg, data=None):  # real signature unknown
         self.no = no
         self.msg = msg
+        self.data = data
 
     def __str__(self):
         return self.msg
@@ -46,9 +50,10 @@ class CMDBEntityError(CMDBError):
 class CMDBValueError(CMDBError):
     """ this is cmdb's Exception for check the value """
 
-    def __init__(self, no, msg):  # real signature unknown
+    def __init__(self, no, msg, data=None):  # real signature unknown
         self.no = no
         self.msg = msg
+        self.data = data
 
     def __str__(self):
         return self.msg
@@ -0,0 +1,107 @@
+from sqlalchemy import func, bindparam
+from sqlalchemy.orm import aliased
+from cmdb.models import session, Value
+from cmdb.catalog import catalog
+from cmdb.exceptions import CMDBFieldError
+from cmdb.tools import FieldMeta
+from cmdb.validation import validate_values
+
+SAMPLE_SIZE = 10  # 检查不通过时返回的样例数量
+CHECK_CHUNK = 10000  # 校验时每批读取的值数量
+
+
+def duplicate_values(field_id, limit=SAMPLE_SIZE) -> list:
+    """ 字段中重复的值 """
+    query = session.query(func.min(Value.value), func.count(Value.id)) \
+        .filter((Value.is_delete==False)&(Value.field_id==field_id)&(Value.value_hash != None)) \
+        .group_by(Value.value_hash).having(func.count(Value.id) > 1).limit(limit)
+    return [{"value": value, "count": count} for value, count in query]
+
+
+def multiple_values(field_id, limit=SAMPLE_SIZE) -> list:
+    """ 有多个值的实体 """
+    query = session.query(Value.entity_id, func.count(Value.id)) \
+        .filter((Value.is_delete==False)&(Value.field_id==field_id)) \
+        .group_by(Value.entity_id).having(func.count(Value.id) > 1).limit(limit)
+    return [{"entity_id": entity_id, "count": count} for entity_id, count in query]
+
+
+def relation_conflicts(field_id, target_id, limit=SAMPLE_SIZE) -> list:
+    """ 在关联目标字段中不存在的值 """
+    target = aliased(Value)
+    query = session.query(Value.id, Value.value) \
+        .outerjoin(target, (target.field_id==target_id)&(target.is_delete==False)&(target.value_hash==Value.value_hash)) \
+        .filter((Value.is_delete==False)&(Value.field_id==field_id)&(Value.value != None)&(target.id == None)) \
+        .limit(limit)
+    return [{"id": id_, "value": value} for id_, value in query]
+
+
+def invalid_values(field_id, meta: FieldMeta, limit=SAMPLE_SIZE, dispatch=CHECK_CHUNK) -> list:
+    """ 按主键分批读取字段的值并校验，遇到第一批有不合法值的数据即停止 """
+    last = 0
+    while True:  # mysqlconnector 不支持服务端游标，按主键分批读取以限制内存
+        rows = session.query(Value.id, Value.value) \
+            .filter((Value.is_delete==False)&(Value.field_id==field_id)&(Value.id > last)) \
+            .order_by(Value.id).limit(dispatch).all()
+        if not rows:
+            return []
+        errors = validate_values(meta, [value for _, value in rows])
+        if errors:
+            return [{"id": rows[index][0], "value": value, "errmsg": errmsg} for index, value, errmsg in errors[:limit]]
+        last = rows[-1][0]
+
+
+def reshadow(field_id, meta: FieldMeta, dispatch=1000):
+    """ 字段类型变更后重新计算值的类型化影子列，需在同一事务中调用 """
+    table = Value.__table__
+    columns = list(meta.shadow(None))
+    statement = table.update().where(table.c.id == bindparam("_id")) \
+        .values(**{column: bindparam(f"_{column}") for column in columns})
+    last = 0
+    while True:  # 边读边写，按主键分批读取而不使用流式游标
+        rows = session.query(Value.id, Value.value) \
+            .filter((Value.is_delete==False)&(Value.field_id==field_id)&(Value.id > last)) \
+            .order_by(Value.id).limit(dispatch).all()
+        if not rows:
+            break
+        params = []
+        for id_, value in rows:
+            shadow = meta.shadow(value)
+            params.append(dict(_id=id_, **{f"_{column}": shadow[column] for column in columns}))
+        session.execute(statement, params)
+        last = rows[-1][0]
+
+
+def check(field, src_meta: FieldMeta, meta: FieldMeta):
+    """
+    检查字段元属性能否从 src_meta 修改为 meta，不满足时抛出 CMDBFieldError，data 为不满足条件的样例
+    """
+    if meta.unique != src_meta.unique:
+        if meta.unique:
+            duplicates = duplicate_values(field.id)
+            if duplicates:
+                raise CMDBFieldError(
+                    1107, "Unique constraint of field cannot be modified, because the value is not unique", duplicates)
+        elif catalog.referencing(field.id):
+            raise CMDBFieldError(1111, "Unique constraint of field cannot be modified, because has association field")
+    if meta.multiple != src_meta.multiple and not meta.multiple:
+        entities = multiple_values(field.id)
+        if entities:
+            raise CMDBFieldError(
+                1108, "Multi value constraint of field cannot be modified, because the value has multiple values", entities)
+    if meta.relation != src_meta.relation and meta.relation:
+        target = catalog.field(meta.relation.target)
+        if target is None:
+            raise CMDBFieldError(1109, "The associated target field does not exist")
+        ref_meta = target.fieldmeta
+        if ref_meta.type != meta.type:
+            raise CMDBFieldError(1110, "Association target field type error")
+        if not ref_meta.unique:
+            raise CMDBFieldError(1102, "Non unique field cannot be a foreign key")
+        conflicts = relation_conflicts(field.id, target.id)
+        if conflicts:
+            raise CMDBFieldError(1112, "Association target field has conflict", conflicts)
+    if not meta.equal(src_meta) or meta.nullable != src_meta.nullable:
+        invalid = invalid_values(field.id, meta)
+        if invalid:
+            raise CMDBFieldError(1113, "Cannot update field meta because there is a value mismatch", invalid)
@@ -0,0 +1,86 @@
+import ipaddress
+from cmdb.models import Value
+from cmdb.tools import value_hash
+from cmdb.types_ import types, pack_ip, PREFIX_LEN
+
+RANGES = {
+    "gt": lambda column, operand: column > operand,
+    "gte": lambda column, operand: column >= operand,
+    "lt": lambda column, operand: column < operand,
+    "lte": lambda column, operand: column <= operand,
+}
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _coerce(type_, operand):
+    if operand is None or operand == "":
+        raise ValueError("Filter operand cannot be empty")
+    try:
+        return type_.coerce(operand)
+    except Exception:
+        raise ValueError(f"Filter operand {operand} is not a legal {type_.__name__}")
+
+
+def _equal(type_, operands: list):
+    if type_.column and type_.column != "value_prefix":
+        column = getattr(Value, type_.column)
+        operands = [_coerce(type_, operand) for operand in operands]
+    else:
+        column = Value.value_hash
+        operands = [value_hash(operand) for operand in operands]
+    if len(operands) == 1:
+        return column == operands[0]
+    return column.in_(operands)
+
+
+def _compile(type_, op, operand):
+    if op not in type_.operators:
+        raise ValueError(f"Operator {op} is not supported by {type_.__name__}")
+    if op == "eq":
+        return _equal(type_, [operand])
+    if op == "in":
+        if not isinstance(operand, (list, tuple)) or not operand:
+            raise ValueError("Operator in requires a non-empty list")
+        return _equal(type_, list(operand))
+    if op == "like":
+        return Value.value.like(f"%{escape_like(str(operand))}%", escape="\\")
+    if op == "prefix":
+        prefix = escape_like(str(operand))
+        column = Value.value_prefix if len(str(operand)) <= PREFIX_LEN else Value.value
+        return column.like(f"{prefix}%", escape="\\")
+    if op == "cidr":
+        try:
+            network = ipaddress.ip_network(operand, strict=False)
+        except Exception:
+            raise ValueError(f"Filter operand {operand} is not a legal network")
+        low, high = pack_ip(network.network_address), pack_ip(network.broadcast_address)
+        return Value.value_ip.between(low, high)
+    column = getattr(Value, type_.column)
+    if op == "between":
+        if not isinstance(operand, (list, tuple)) or len(operand) != 2:
+            raise ValueError("Operator between requires [low, high]")
+        return column.between(_coerce(type_, operand[0]), _coerce(type_, operand[1]))
+    return RANGES[op](column, _coerce(type_, operand))
+
+
+def compile_filter(field, cond):
+    """
+    将一个字段的查询条件编译为 value 表上的谓词
+    :param field: 字段，需带 fieldmeta
+    :param cond: 标量时为模糊匹配（兼容旧接口）；
+                 dict 时为 {操作符: 操作数}，支持 eq, in, like, prefix, gt, gte, lt, lte, between, cidr，
+                 多个操作符之间为 AND，例如 {"gte": 1024, "lt": 2048}
+    :return: (Value.field_id == field.id) & ...
+    """
+    type_ = types[field.fieldmeta.type]
+    if not isinstance(cond, dict):
+        cond = {"like": cond}
+    if not cond:
+        raise ValueError(f"Empty filter for field {field.name}")
+    predicate = Value.field_id == field.id
+    for op, operand in cond.items():
+        predicate &= _compile(type_, op, operand)
+    return predicate
@@ -0,0 +1,86 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from cmdb import add_entity, add_entities
+from cmdb.models import session
+from cmdb.exceptions import CMDBValueError
+from cmdb.tools import get_logger
+from settings import GROUP_COMMIT_WINDOW, GROUP_COMMIT_BATCH
+
+logger = get_logger("groupcommit", is_print=False)
+
+
+class GroupCommitter:
+    """
+    组提交：合并一个时间窗口内对同一张表的并发 add_entity 请求，通过 add_entities 批量写入、一次提交。
+    批量写入在单独的线程中串行执行，不阻塞事件循环；整批写入失败时逐行用 add_entity 重试，只有出错的行收到异常
+    """
+
+    def __init__(self, window=0.005, max_batch=500):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}  # {schema_id: [(values, future)]}
+        self._timers = {}  # {schema_id: 窗口到期的 call_later 句柄}
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def add(self, schema_id, values: dict):
+        """ 加入当前批次并等待批次提交，该行校验失败时抛出对应的 CMDBValueError """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(schema_id, [])
+        batch.append((values, future))
+        if len(batch) >= self.max_batch:
+            self._flush(schema_id)
+        elif len(batch) == 1:
+            self._timers[schema_id] = loop.call_later(self.window, self._flush, schema_id)
+        return await future
+
+    def _flush(self, schema_id):
+        timer = self._timers.pop(schema_id, None)
+        if timer is not None:  # 批次满提前提交时取消窗口定时器，避免它提前提交下一批
+            timer.cancel()
+        batch = self._pending.pop(schema_id, None)
+        if batch:
+            asyncio.ensure_future(self._commit(schema_id, batch))
+
+    def _add_entities(self, schema_id, rows) -> list:
+        """ 在写入线程中执行，返回每行的结果：None 或该行的异常 """
+        try:
+            try:
+                errors = add_entities(schema_id, rows)
+            except Exception as e:  # 整批失败（并发唯一冲突、数据库错误等），逐行重试
+                session.rollback()
+                logger.error(f"schema {schema_id}: group commit of {len(rows)} rows failed, retry row by row: {e}")
+                return [self._add_entity(schema_id, values) for values in rows]
+            failed = {error["row"]: CMDBValueError(error["errno"], error["errmsg"]) for error in errors}
+            return [failed.get(index) for index in range(len(rows))]
+        finally:
+            session.remove()
+
+    def _add_entity(self, schema_id, values):
+        try:
+            add_entity(schema_id=schema_id, values=values)
+        except Exception as e:
+            session.rollback()
+            return e
+        return None
+
+    async def _commit(self, schema_id, batch):
+        loop = asyncio.get_event_loop()
+        try:
+            results = await loop.run_in_executor(
+                self._executor, self._add_entities, schema_id, [values for values, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), error in zip(batch, results):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(None)
+
+
+committer = GroupCommitter(GROUP_COMMIT_WINDOW, GROUP_COMMIT_BATCH)
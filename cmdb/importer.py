@@ -0,0 +1,166 @@
+import os
+import csv
+import uuid
+from datetime import datetime, date, time
+from cmdb import add_entity, add_entities, list_field
+from cmdb.models import session
+from cmdb.tools import get_logger, chunked, RET
+from cmdb.exceptions import CMDBError
+from settings import IMPORT_PATH
+
+logger = get_logger("importer", is_print=False)
+
+CHUNK_SIZE = 1000  # 每批校验并提交的行数
+
+
+def _cell(value):
+    """
+    单元格统一转为字符串，与 CSV 及接口传入的值一致：空单元格为 None，整数值的浮点数去掉小数部分
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, time):
+        return value.strftime("%H:%M:%S")
+    return str(value)
+
+
+def _xlsx_cell(cell):
+    """ openpyxl 按单元格格式把日期读为 datetime，按格式区分日期、时间和日期时间 """
+    from openpyxl.styles.numbers import is_datetime
+    value = cell.value
+    if isinstance(value, datetime):
+        kind = is_datetime(cell.number_format)
+        if kind == "date":
+            return _cell(value.date())
+        if kind == "time":
+            return _cell(value.time())
+    return _cell(value)
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.reader(f):
+            yield [_cell(value) for value in row]
+
+
+def read_xlsx(path):
+    import openpyxl
+    book = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in book.worksheets[0].iter_rows():
+            yield [_xlsx_cell(cell) for cell in row]
+    finally:
+        book.close()
+
+
+def _xls_cell(cell, datemode):
+    """ xls 的日期单元格是序列号浮点数，没有小数部分的为日期，小于 1 的为时间 """
+    import xlrd
+    if cell.ctype == xlrd.XL_CELL_DATE:
+        value = xlrd.xldate.xldate_as_datetime(cell.value, datemode)
+        if cell.value < 1:
+            return _cell(value.time())
+        if float(cell.value).is_integer():
+            return _cell(value.date())
+        return _cell(value)
+    if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+        return _cell(bool(cell.value))
+    return _cell(cell.value)
+
+
+def read_xls(path):
+    """ xls 格式无法流式读取，按需加载第一个工作表 """
+    import xlrd
+    book = xlrd.open_workbook(path, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        for row in range(sheet.nrows):
+            yield [_xls_cell(cell, book.datemode) for cell in sheet.row(row)]
+    finally:
+        book.release_resources()
+
+
+READERS = {".csv": read_csv, ".xlsx": read_xlsx, ".xls": read_xls}
+
+
+def iter_rows(path, filename):
+    suffix = os.path.splitext(filename or "")[1].lower()
+    if suffix not in READERS:
+        raise ValueError(f"Unsupported file type {suffix}")
+    return READERS[suffix](path)
+
+
+def report_path(report_id) -> str:
+    report_id = uuid.UUID(hex=report_id).hex
+    return os.path.join(IMPORT_PATH, f"{report_id}.csv")
+
+
+def _import_chunk(schema_id, rows) -> list:
+    """
+    通过 add_entities 写入一批行；整批失败（并发唯一冲突、数据库错误等）时回滚并逐行用 add_entity 重试，
+    出错的行记入返回值而不中断导入
+    :return: 同 add_entities
+    """
+    try:
+        return add_entities(schema_id, rows)
+    except Exception as e:
+        session.rollback()
+        logger.error(f"schema {schema_id}: import chunk of {len(rows)} rows failed, retry row by row: {e}")
+    errors = []
+    for index, values in enumerate(rows):
+        try:
+            add_entity(schema_id=schema_id, values=values)
+        except CMDBError as e:
+            session.rollback()
+            errors.append({"row": index, "errno": e.no, "errmsg": e.msg})
+        except ValueError as e:
+            session.rollback()
+            errors.append({"row": index, "errno": RET.VERR, "errmsg": str(e)})
+        except Exception as e:
+            session.rollback()
+            logger.error(e)
+            errors.append({"row": index, "errno": RET.DBERR, "errmsg": str(e)})
+    return errors
+
+
+def import_file(schema_id, path, filename):
+    """
+    流式导入表格：逐批校验并通过 add_entities 提交，出错的行写入错误报告
+    在线程池中执行，结束时释放本线程的会话
+    :return: {"total", "imported", "failed", "report"}，report 为错误报告 ID，没有错误行时为 None
+    """
+    report_id = uuid.uuid4().hex
+    total = failed = 0
+    try:
+        rows = iter_rows(path, filename)
+        header = next(rows, None)
+        if not header:
+            raise ValueError("Empty file")
+        header = [str(name).strip() if name is not None else None for name in header]
+        if not set(header) & {field.name for field in list_field(schema_id)}:
+            raise ValueError("File header does not match the table fields")
+
+        os.makedirs(IMPORT_PATH, exist_ok=True)
+        with open(report_path(report_id), "w", newline="", encoding="utf-8-sig") as report:
+            writer = csv.writer(report)
+            writer.writerow(["row", "errno", "errmsg"])
+            for offset, chunk in enumerate(chunked(rows, CHUNK_SIZE)):
+                total += len(chunk)
+                errors = _import_chunk(schema_id, [dict(zip(header, values)) for values in chunk])
+                for error in errors:
+                    # 表格中的行号，表头为第 1 行
+                    writer.writerow([offset * CHUNK_SIZE + error["row"] + 2, error["errno"], error["errmsg"]])
+                failed += len(errors)
+        if not failed:
+            os.remove(report_path(report_id))
+            report_id = None
+        logger.info(f"schema {schema_id}: import {filename}, total {total}, failed {failed}")
+        return dict(total=total, imported=total - failed, failed=failed, report=report_id)
+    finally:
+        session.remove()
@@ -0,0 +1,104 @@
+import logging
+from sqlalchemy import inspect, bindparam
+from sqlalchemy.exc import IntegrityError
+from cmdb.models import engine, session, Base, Field, Value
+from cmdb.tools import get_logger, FieldMeta, itemiter, chunked, value_hash
+
+logger = get_logger("migrate", level=logging.INFO, is_print=True)
+
+
+def sync_table(table):
+    """
+    为已存在的表补齐模型中新增的列和索引，表不存在时直接创建
+    :param table: 模型的 __table__
+    """
+    table.create(engine, checkfirst=True)
+    inspector = inspect(engine)
+    columns = {column["name"] for column in inspector.get_columns(table.name)}
+    indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+    for column in table.columns:
+        if column.name not in columns:
+            type_ = column.type.compile(engine.dialect)
+            engine.execute(f"ALTER TABLE `{table.name}` ADD COLUMN `{column.name}` {type_}")
+            logger.info(f"{table.name}: add column {column.name}")
+    for index in table.indexes:
+        if index.name not in indexes:
+            index.create(engine)
+            logger.info(f"{table.name}: add index {index.name}")
+
+
+def backfill_value_shadow(dispatch=1000):
+    """ 为历史数据填充 value 表的 value_hash 及类型化影子列，可重复执行 """
+    for field in session.query(Field).all():
+        meta = FieldMeta().loads(field.meta)
+        query = session.query(Value) \
+            .filter((Value.field_id==field.id)&(Value.value != None)&(Value.value_hash == None))
+        count = 0
+        for values in chunked(itemiter(query, dispatch), dispatch):
+            for value in values:
+                try:
+                    shadow = meta.shadow(value.value)
+                except Exception as e:  # 历史非法值只填充 value_hash
+                    logger.error(f"value {value.id}: {e}")
+                    shadow = {"value_hash": value_hash(value.value)}
+                for column, item in shadow.items():
+                    setattr(value, column, item)
+            session.commit()
+            count += len(values)
+        if count:
+            logger.info(f"field {field.id}: backfill {count} values")
+
+
+def rehash_values(dispatch=1000):
+    """
+    按当前 value_hash 规则重新计算历史值的哈希，可重复执行；
+    哈希有变化的唯一值清空 unique_hash，随后由 backfill_unique_hash 重新填充
+    """
+    table = Value.__table__
+    statement = table.update().where(table.c.id == bindparam("_id")) \
+        .values(value_hash=bindparam("_hash"), unique_hash=None)
+    last = count = 0
+    while True:
+        rows = session.query(Value.id, Value.value, Value.value_hash) \
+            .filter((Value.value != None)&(Value.id > last)).order_by(Value.id).limit(dispatch).all()
+        if not rows:
+            break
+        params = [dict(_id=id_, _hash=value_hash(value)) for id_, value, hash_ in rows if value_hash(value) != hash_]
+        if params:
+            session.execute(statement, params)
+            session.commit()
+            count += len(params)
+        last = rows[-1][0]
+    if count:
+        logger.info(f"rehash {count} values")
+
+
+def backfill_field_unique():
+    """ 按 meta 填充 field 表的 unique 列，可重复执行 """
+    for field in session.query(Field).all():
+        field.unique = bool(FieldMeta().loads(field.meta).unique)
+    session.commit()
+
+
+def backfill_unique_hash():
+    """ 为唯一字段填充 unique_hash，已有重复值的字段记录错误后跳过 """
+    for field in session.query(Field).filter((Field.is_delete==False)&(Field.unique==True)).all():
+        try:
+            session.query(Value) \
+                .filter((Value.is_delete==False)&(Value.field_id==field.id)&(Value.unique_hash == None)) \
+                .update({Value.unique_hash: Value.value_hash}, synchronize_session=False)
+            session.commit()
+        except IntegrityError as e:
+            session.rollback()
+            logger.error(f"field {field.id}: duplicate values, unique index not enforced")
+
+
+if __name__ == '__main__':
+    for table in Base.metadata.sorted_tables:
+        sync_table(table)
+    backfill_field_unique()
+    backfill_value_shadow()
+    rehash_values()
+    backfill_unique_hash()
+    from cmdb.projection import rebuild_documents
+    rebuild_documents()
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, DateTime, Boolean, Integer, String, Text
+from sqlalchemy import Column, DateTime, Boolean, Integer, BigInteger, Float, Numeric, String, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import create_engine, ForeignKey, func
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship
 from datetime import datetime
 from settings import MYSQL_URI
 
@@ -10,7 +10,7 @@ engine = create_engine(MYSQL_URI, echo=False)
 Base = declarative_base()
 Session = sessionmaker()
 Session.configure(bind=engine)
-session = Session()
+session = scoped_session(Session)  # 每个线程独立的会话，导入等任务在线程池中执行
 
 
 class BaseModel:
@@ -24,6 +24,7 @@ class Schema(BaseModel, Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(48), nullable=False)
     desc = Column(String(128))
+    materialized = Column(Boolean, default=False)  # 是否维护宽表投影
 
 
 class Field(BaseModel, Base):
@@ -32,6 +33,7 @@ class Field(BaseModel, Base):
     name = Column(String(48), nullable=False)
     meta = Column(Text)
     ref = Column(Integer)
+    unique = Column(Boolean, default=False, index=True)  # 冗余 meta 中的 unique，供关联目录查询
     desc = Column(String(128))
     schema_id = Column(Integer, ForeignKey("schema.id"), nullable=False)
     values = relationship("Value", backref="field")
@@ -40,8 +42,9 @@ class Field(BaseModel, Base):
 class Entity(BaseModel, Base):
     __tablename__ = "entity"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    key = Column(String(48), nullable=False)
+    key = Column(String(48), nullable=False, index=True)  # add_entities 按 key 回查批量插入的实体 ID
     schema_id = Column(Integer, ForeignKey("schema.id"), nullable=False)
+    document = Column(Text)  # 当前字段值的 JSON 文档 {field_id: 值}，与值在同一事务中重写
     values = relationship("Value", backref="entity")
 
     def todict(self):
@@ -54,11 +57,48 @@ class Value(BaseModel, Base):
     value = Column(Text)
     field_id = Column(Integer, ForeignKey("field.id"), nullable=False)
     entity_id = Column(Integer, ForeignKey("entity.id"), nullable=False)
+    # 类型化影子列，写入时由字段类型填充，用于等值、范围查询走索引
+    value_hash = Column(String(40))
+    value_int = Column(BigInteger)
+    value_float = Column(Float(precision=53))
+    value_time = Column(DateTime)
+    value_ip = Column(Numeric(39, 0))
+    value_prefix = Column(String(64))
+    # 唯一字段未删除的值填充 value_hash，其余为 NULL，由唯一索引保证字段值唯一
+    unique_hash = Column(String(40))
+
+    __table_args__ = (
+        Index("ix_value_entity_field", "entity_id", "field_id"),
+        Index("ix_value_field_hash", "field_id", "value_hash"),
+        Index("ix_value_field_int", "field_id", "value_int"),
+        Index("ix_value_field_float", "field_id", "value_float"),
+        Index("ix_value_field_time", "field_id", "value_time"),
+        Index("ix_value_field_ip", "field_id", "value_ip"),
+        Index("ix_value_field_prefix", "field_id", "value_prefix"),
+        Index("ux_value_field_unique", "field_id", "unique_hash", unique=True),
+    )
 
     def todict(self):
         return dict(id=self.id, value=self.value)
 
 
+class Token(Base):
+    """ 值的三元组倒排索引，用于全文搜索 """
+    __tablename__ = "token"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    token = Column(String(12), nullable=False)
+    value_id = Column(Integer, ForeignKey("value.id"), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    field_id = Column(Integer, nullable=False)
+    schema_id = Column(Integer, nullable=False)
+    value = relationship("Value")
+
+    __table_args__ = (
+        Index("ix_token_token_schema", "token", "schema_id"),
+        Index("ix_token_value", "value_id"),
+    )
+
+
 if __name__ == '__main__':
     Base.metadata.create_all(engine)
     # Base.metadata.drop_all(engine)
\ No newline at end of file
@@ -0,0 +1,100 @@
+from sqlalchemy import exists, false, func
+from cmdb.models import session, Session, Entity, Value
+from cmdb.filters import compile_filter
+
+STATS_INTERVAL = 300  # 后台刷新字段统计信息的间隔秒数
+MATERIALIZE_LIMIT = 5000  # 预估命中数不超过该值的条件先查出实体ID集合再求交集
+DEFAULT_STATS = (100000, 1000)  # 还没有统计信息的字段按该 (行数, 不同值个数) 估算
+
+SELECTIVITY = {
+    "prefix": 0.1,
+    "cidr": 0.1,
+    "between": 0.1,
+    "gt": 0.3,
+    "gte": 0.3,
+    "lt": 0.3,
+    "lte": 0.3,
+    "like": 0.5,
+}
+
+_stats = {}
+
+
+def refresh_stats():
+    """
+    一次分组查询重新统计全部字段，需全表扫描 value 表，由后台任务定期调用，不在请求中执行；
+    使用独立的会话，读取最新提交的数据
+    """
+    global _stats
+    db = Session()
+    try:
+        query = db.query(Value.field_id, func.count(Value.id), func.count(func.distinct(Value.value_hash))) \
+            .filter(Value.is_delete==False).group_by(Value.field_id)
+        _stats = {field_id: (rows, distinct) for field_id, rows, distinct in query}
+    finally:
+        db.close()
+
+
+def field_stats(field_id: int) -> tuple:
+    """
+    字段的值统计信息，取自后台刷新的结果，没有统计信息时返回 DEFAULT_STATS
+    :return: (值的行数, 不同值的个数)
+    """
+    return _stats.get(field_id, DEFAULT_STATS)
+
+
+def estimate(field, cond) -> float:
+    """ 预估条件命中的值行数 """
+    rows, distinct = field_stats(field.id)
+    if not rows:
+        return 0
+    if not isinstance(cond, dict):
+        cond = {"like": cond}
+    selectivity = 1.0
+    for op, operand in cond.items():
+        if op == "eq":
+            selectivity = min(selectivity, 1 / max(distinct, 1))
+        elif op == "in":
+            selectivity = min(selectivity, len(operand) / max(distinct, 1))
+        else:
+            selectivity = min(selectivity, SELECTIVITY.get(op, 1.0))
+    return rows * selectivity
+
+
+def _entity_ids(predicate):
+    query = session.query(Value.entity_id) \
+        .filter((Value.is_delete==False)&predicate).distinct().limit(MATERIALIZE_LIMIT + 1)
+    ids = {row[0] for row in query}
+    if len(ids) > MATERIALIZE_LIMIT:
+        return None
+    return ids
+
+
+def plan(schema_id: int, query: dict = None, fields: list = None):
+    """
+    生成实体查询：每个字段条件单独成为一个半连接，按预估选择性从高到低排列；
+    命中少的条件先取出实体ID集合并求交集，其余条件以 EXISTS 子查询过滤
+    :return: Entity 查询
+    """
+    cond = (Entity.is_delete==False) & (Entity.schema_id==schema_id)
+    predicates = []
+    if query and fields:
+        for field in fields:
+            cond_val = query.get(field.name)
+            if cond_val:
+                predicate = compile_filter(field, cond_val)  # 先编译，非法条件以 ValueError 返回
+                predicates.append((estimate(field, cond_val), field.id, predicate))
+    predicates.sort(key=lambda x: x[:2])
+
+    ids = None
+    for estimated, _, predicate in predicates:
+        found = _entity_ids(predicate) if estimated <= MATERIALIZE_LIMIT else None
+        if found is None:
+            cond &= exists().where((Value.entity_id==Entity.id)&(Value.is_delete==False)&predicate)
+            continue
+        ids = found if ids is None else ids & found
+        if not ids:
+            return session.query(Entity).filter(false())
+    if ids is not None:
+        cond &= Entity.id.in_(ids)
+    return session.query(Entity).filter(cond)
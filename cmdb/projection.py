@@ -0,0 +1,254 @@
+import sys
+import json
+from datetime import datetime
+from sqlalchemy import event, select, bindparam, MetaData, Table, Column, Integer, String, DateTime, Text
+from cmdb.models import session, Session, Schema, Entity, Value
+from cmdb.catalog import catalog
+from cmdb.tools import itemiter, chunked
+from settings import ENTITY_DOCUMENT
+
+
+def table_name(schema_id) -> str:
+    return f"schema_{int(schema_id)}_record"
+
+
+def column_name(field_id) -> str:
+    return f"f_{int(field_id)}"
+
+
+def table(schema_id) -> Table:
+    """ 表的宽表投影：每个实体一行，每个字段一列，列值为值的 JSON（多值字段为数组） """
+    return catalog.derived(("projection", int(schema_id)), lambda: Table(
+        table_name(schema_id), MetaData(),
+        Column("entity_id", Integer, primary_key=True, autoincrement=False),
+        Column("key", String(48)),
+        Column("createtime", DateTime),
+        Column("updatetime", DateTime),
+        *[Column(column_name(field.id), Text) for field in catalog.fields(schema_id)]
+    ))
+
+
+def _documents(schema_id, entity_ids: list) -> list:
+    """
+    读取实体当前的字段值
+    :return: [(实体列 dict, {field_id: {"id", "value"} 或多值时的数组}), ...]
+    """
+    fields = catalog.fields(schema_id)
+    entities = session.query(Entity.id, Entity.key, Entity.createtime, Entity.updatetime) \
+        .filter((Entity.is_delete==False)&(Entity.schema_id==schema_id)&(Entity.id.in_(entity_ids)))
+    rows = {id_: dict(entity_id=id_, key=key, createtime=createtime, updatetime=updatetime)
+            for id_, key, createtime, updatetime in entities}
+    grouped = {}
+    if rows and fields:
+        values = session.query(Value.id, Value.value, Value.entity_id, Value.field_id) \
+            .filter((Value.is_delete==False)&(Value.entity_id.in_(list(rows)))
+                    &(Value.field_id.in_([field.id for field in fields]))).order_by(Value.id)
+        for id_, value, entity_id, field_id in values:
+            grouped.setdefault((entity_id, field_id), []).append(dict(id=id_, value=value))
+    documents = []
+    for entity_id, row in rows.items():
+        document = {}
+        for field in fields:
+            values = grouped.get((entity_id, field.id), [])
+            if field.fieldmeta.multiple:
+                document[field.id] = values
+            else:
+                document[field.id] = values[0] if values else None
+        documents.append((row, document))
+    return documents
+
+
+def refresh(schema_id, entity_ids):
+    """ 在当前事务中重写实体的 document 列以及宽表行，已删除的实体只删除宽表行 """
+    materialized = catalog.materialized(schema_id)
+    if not materialized and not ENTITY_DOCUMENT:
+        return
+    projection = table(schema_id) if materialized else None
+    entity = Entity.__table__
+    for ids in chunked(sorted(entity_ids), 500):
+        documents = _documents(schema_id, ids)
+        if ENTITY_DOCUMENT and documents:
+            session.execute(
+                entity.update().where(entity.c.id == bindparam("_id")).values(document=bindparam("_document")),
+                [dict(_id=row["entity_id"], _document=json.dumps(document)) for row, document in documents]
+            )
+        if materialized:
+            session.execute(projection.delete().where(projection.c.entity_id.in_(ids)))
+            if documents:
+                session.execute(projection.insert(), [_row(row, document) for row, document in documents])
+
+
+def _row(row: dict, document: dict) -> dict:
+    row = dict(row)
+    for field_id, value in document.items():
+        row[column_name(field_id)] = json.dumps(value)
+    return row
+
+
+def touch(schema_id, entity_ids):
+    """ 标记实体在本事务中有变更，提交前统一刷新投影；批量 SQL 写入时需显式调用 """
+    session.info.setdefault("touched", {}).setdefault(int(schema_id), set()).update(entity_ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect(session_, context):
+    touched = session_.info.setdefault("touched", {})
+    for obj in list(session_.new) + list(session_.dirty) + list(session_.deleted):
+        if isinstance(obj, Entity) and obj.id:
+            touched.setdefault(int(obj.schema_id), set()).add(obj.id)
+        elif isinstance(obj, Value) and obj.entity_id:
+            field = catalog.field(obj.field_id)
+            if field:
+                touched.setdefault(field.schema_id, set()).add(obj.entity_id)
+
+
+@event.listens_for(Session, "before_commit")
+def _sync(session_):
+    session_.flush()
+    touched = session_.info.pop("touched", {})
+    for schema_id, entity_ids in touched.items():
+        refresh(schema_id, entity_ids)
+    session_.info.setdefault("committed", set()).update(touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session_):
+    session_.info.pop("touched", None)
+    session_.info.pop("committed", None)
+
+
+def records(schema_id, entities: list, fields: list, fallback) -> list:
+    """
+    从宽表读取一页记录，格式与 _format_record 一致
+    :param fallback: 宽表中还没有行的实体（如重建期间新增的实体）改用 fallback(entities, fields) 读取
+    """
+    projection = table(schema_id)
+    columns = [projection.c.entity_id] + [projection.c[column_name(field.id)] for field in fields]
+    rows = {row[0]: row for row in
+            session.execute(select(columns).where(projection.c.entity_id.in_([entity.id for entity in entities])))}
+    missing = [entity for entity in entities if entity.id not in rows]
+    formatted = {record["id"]: record for record in fallback(missing, fields)} if missing else {}
+    data = []
+    for entity in entities:
+        if entity.id in formatted:
+            data.append(formatted[entity.id])
+            continue
+        record = entity.todict()
+        row = rows[entity.id]
+        for index, field in enumerate(fields, 1):
+            record.update({field.name: json.loads(row[index]) if row[index] else None})
+        data.append(record)
+    return data
+
+
+def drop(schema_id):
+    table(schema_id).drop(session.connection(), checkfirst=True)
+    session.commit()
+
+
+def add_column(field):
+    if catalog.materialized(field.schema_id):
+        session.execute(f"ALTER TABLE `{table_name(field.schema_id)}` ADD COLUMN `{column_name(field.id)}` TEXT")
+        session.commit()
+
+
+def drop_column(field):
+    if catalog.materialized(field.schema_id):
+        session.execute(f"ALTER TABLE `{table_name(field.schema_id)}` DROP COLUMN `{column_name(field.id)}`")
+        session.commit()
+
+
+def _swap(schema_id, building: Table):
+    """ 用新建好的宽表替换当前宽表，MySQL 下 RENAME TABLE 原子交换 """
+    live, old = table_name(schema_id), f"{table_name(schema_id)}_old"
+    session.execute(f"DROP TABLE IF EXISTS `{old}`")
+    if session.bind.dialect.name == "mysql":
+        session.execute(f"RENAME TABLE `{live}` TO `{old}`, `{building.name}` TO `{live}`")
+    else:
+        session.execute(f"ALTER TABLE `{live}` RENAME TO `{old}`")
+        session.execute(f"ALTER TABLE `{building.name}` RENAME TO `{live}`")
+    session.execute(f"DROP TABLE `{old}`")
+    session.commit()
+
+
+def rebuild(schema_id, dispatch=500):
+    """
+    重建表的宽表投影：先写入临时表再整体换入，重建期间读请求仍使用原宽表。
+    重建期间有变更的实体在换入后重新刷新
+    """
+    projection = table(schema_id)
+    building = projection.tometadata(MetaData(), name=f"{table_name(schema_id)}_new")
+    started = datetime.now()
+    projection.create(session.connection(), checkfirst=True)
+    building.drop(session.connection(), checkfirst=True)
+    building.create(session.connection())
+    session.commit()
+    query = session.query(Entity).filter((Entity.is_delete==False)&(Entity.schema_id==schema_id))
+    for entities in chunked(itemiter(query, dispatch), dispatch):
+        documents = _documents(schema_id, [entity.id for entity in entities])
+        if documents:
+            session.execute(building.insert(), [_row(row, document) for row, document in documents])
+        session.commit()
+    _swap(schema_id, building)
+
+    changed = {id_ for id_, in session.query(Entity.id)
+               .filter((Entity.schema_id==schema_id)&(Entity.updatetime >= started))}
+    fields = [field.id for field in catalog.fields(schema_id)]
+    if fields:
+        changed.update(id_ for id_, in session.query(Value.entity_id).distinct()
+                       .filter((Value.field_id.in_(fields))&(Value.updatetime >= started)))
+    if changed:
+        refresh(schema_id, changed)
+        session.commit()
+
+
+def rewrite(schema_id, dispatch=500):
+    """ 按主键分批重写表中实体的 document 列和宽表行，每批单独提交 """
+    if not catalog.materialized(schema_id) and not ENTITY_DOCUMENT:
+        return
+    last = 0
+    while True:
+        ids = [id_ for id_, in session.query(Entity.id)
+               .filter((Entity.is_delete==False)&(Entity.schema_id==schema_id)&(Entity.id > last))
+               .order_by(Entity.id).limit(dispatch)]
+        if not ids:
+            break
+        touch(schema_id, ids)
+        session.commit()
+        last = ids[-1]
+
+
+def rebuild_documents(dispatch=500):
+    """ 重写全部实体的 document 列 """
+    for schema in session.query(Schema).filter(Schema.is_delete==False).all():
+        rewrite(schema.id, dispatch)
+
+
+def enable(schema_id):
+    schema = session.query(Schema).filter((Schema.is_delete==False)&(Schema.id==schema_id)).first()
+    if schema is None:
+        raise ValueError(f"Schema with ID {schema_id} does not exist")
+    schema.materialized = True
+    session.commit()
+    catalog.invalidate()
+    rebuild(schema_id)
+
+
+def disable(schema_id):
+    schema = session.query(Schema).get(schema_id)
+    if schema is None:
+        raise ValueError(f"Schema with ID {schema_id} does not exist")
+    schema.materialized = False
+    session.commit()
+    catalog.invalidate()
+    drop(schema_id)
+
+
+if __name__ == '__main__':
+    # python -m cmdb.projection enable|disable|rebuild <schema_id>
+    # python -m cmdb.projection documents
+    if sys.argv[1] == "documents":
+        rebuild_documents()
+    else:
+        command, schema_id = sys.argv[1], int(sys.argv[2])
+        {"enable": enable, "disable": disable, "rebuild": rebuild}[command](schema_id)
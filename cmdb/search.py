@@ -0,0 +1,123 @@
+from sqlalchemy import event, func, desc, select, literal
+from cmdb.models import session, Value, Token
+from cmdb.catalog import catalog
+from cmdb.tools import itemiter, chunked
+from cmdb.filters import escape_like
+
+GRAM = 3
+MAX_INDEX_LEN = 256  # 只索引值的前 256 个字符
+
+
+def tokenize(text, suffixes=True) -> set:
+    """
+    小写后切分为三元组，不足三个字符的值整体作为一个词
+    :param suffixes: 同时加入末尾的一、二字符后缀，使不足三个字符的搜索词以前缀匹配也能命中值的末尾；
+                     建索引时使用，切分搜索词时不使用
+    """
+    if text is None:
+        return set()
+    text = str(text).lower()[:MAX_INDEX_LEN].strip()
+    if not text:
+        return set()
+    if len(text) < GRAM:
+        tokens = {text}
+    else:
+        tokens = {text[i:i+GRAM] for i in range(len(text) - GRAM + 1)}
+    if suffixes:
+        tokens.update(text[-size:] for size in range(1, GRAM))
+    return tokens
+
+
+@event.listens_for(Token, "before_insert")
+def _fill_token(mapper, connection, token):
+    token.entity_id = token.value.entity_id
+    token.field_id = token.value.field_id
+
+
+def unindex_value(value: Value):
+    if value.id:
+        session.query(Token).filter(Token.value_id == value.id).delete(synchronize_session=False)
+
+
+def index_value(value: Value):
+    """ 重建一个值的索引，需在同一事务中调用 """
+    unindex_value(value)
+    field = catalog.field(value.field_id)
+    if field is None:
+        return
+    for token in tokenize(value.value):
+        session.add(Token(value=value, token=token, schema_id=field.schema_id))
+
+
+def index_values(values):
+    """
+    批量写入值的索引，用于多行 INSERT 写入的值，需在同一事务中调用
+    :param values: [(value_id, value, entity_id, field_id), ...]
+    """
+    tokens = []
+    for value_id, value, entity_id, field_id in values:
+        field = catalog.field(field_id)
+        if field is None:
+            continue
+        tokens.extend(dict(token=token, value_id=value_id, entity_id=entity_id, field_id=field_id,
+                           schema_id=field.schema_id) for token in tokenize(value))
+    for chunk in chunked(tokens, 1000):
+        session.execute(Token.__table__.insert(), chunk)
+
+
+def index_field(field_id, schema_id, text):
+    """ 字段下所有值相同（如批量写入的默认值）时，以 INSERT ... SELECT 为每个值写入索引，需在同一事务中调用 """
+    token = Token.__table__
+    for item in tokenize(text):
+        query = select([literal(item), Value.id, Value.entity_id, Value.field_id, literal(schema_id)]) \
+            .where((Value.field_id==field_id)&(Value.is_delete==False))
+        session.execute(token.insert().from_select(["token", "value_id", "entity_id", "field_id", "schema_id"], query))
+
+
+def search(term: str, schema_id: int = None, size: int = 20) -> list:
+    """
+    搜索包含 term 的实体，按命中的三元组数量排序
+    :param term: 搜索词
+    :param schema_id: 限定表，为空时全局搜索
+    :param size: 返回数量
+    :return: [{"entity_id", "schema_id", "score"}]，score 为命中比例
+    """
+    tokens = tokenize(term, suffixes=False)
+    if not tokens:
+        return []
+    size = size if 0 < size < 101 else 20
+    score = func.count(func.distinct(Token.token)).label("score")
+    query = session.query(Token.entity_id, Token.schema_id, score)
+    if len(tokens) == 1 and len(next(iter(tokens))) < GRAM:
+        query = query.filter(Token.token.like(f"{escape_like(next(iter(tokens)))}%", escape="\\"))
+    else:
+        query = query.filter(Token.token.in_(tokens))
+    if schema_id:
+        query = query.filter(Token.schema_id == schema_id)
+    query = query.group_by(Token.entity_id, Token.schema_id).order_by(desc("score"), Token.entity_id).limit(size)
+    return [{
+        "entity_id": entity_id,
+        "schema_id": schema_id_,
+        "score": min(1.0, count / len(tokens))
+    } for entity_id, schema_id_, count in query]
+
+
+def reindex(dispatch=1000):
+    """ 重建全部值的索引 """
+    session.query(Token).delete(synchronize_session=False)
+    session.commit()
+    query = session.query(Value).filter((Value.is_delete==False)&(Value.value != None))
+    for values in chunked(itemiter(query, dispatch), dispatch):
+        for value in values:
+            field = catalog.field(value.field_id)
+            if field is None:
+                continue
+            for token in tokenize(value.value):
+                session.add(Token(value=value, token=token, schema_id=field.schema_id))
+        session.commit()
+
+
+if __name__ == '__main__':
+    from cmdb.migrate import sync_table
+    sync_table(Token.__table__)
+    reindex()
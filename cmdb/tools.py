@@ -2,9 +2,12 @@ import logging
 import os
 import json
 import math
+import time
+import base64
+import hashlib
 from logging import Formatter, StreamHandler
 from logging.handlers import RotatingFileHandler
-from settings import LOG_PATH
+from settings import LOG_PATH, COUNT_CACHE_TTL
 from cmdb.types_ import types
 
 
@@ -34,6 +37,16 @@ def get_logger(name="root", level=logging.ERROR, is_print=False):
     return logger
 
 
+def value_hash(value):
+    """
+    值的等值比较哈希，与原先 Text 列在 MySQL 默认 _ci 排序规则下的比较一致：
+    不区分大小写、忽略末尾空格，"Web01" 与 "web01 " 视为相同的值（唯一性、关联、等值查询）
+    """
+    if value is None:
+        return None
+    return hashlib.sha1(str(value).rstrip(" ").lower().encode()).hexdigest()
+
+
 class FieldMeta(dict):
     def __setattr__(self, key, value):
         raise NotImplementedError("Meta object cannot set!")
@@ -41,8 +54,49 @@ class FieldMeta(dict):
     def __getattr__(self, item):
         return self.get(item)
 
+    def compile(self):
+        """
+        编译并缓存该元属性的校验函数；类型校验会跳过 0、False 等假值，
+        因此同时计算影子列，校验通过的值写入时不会在计算影子列时出错
+        """
+        validator = self._validator
+        if validator is None:
+            type_ = types[self.type]
+            check = type_.compile(self)
+
+            def validator(value):
+                result = check(value)
+                type_.shadow(value)
+                return result
+            object.__setattr__(self, "_validator", validator)
+        return validator
+
     def inspect(self, value):
-        types[self.type].serialize(value=value, metadata=self)
+        return self.compile()(value)
+
+    def validate_many(self, values, first=False):
+        """
+        批量校验
+        :param values: 待校验的值
+        :param first: 遇到第一个错误即停止
+        :return: [(index, value, errmsg), ...]
+        """
+        validate = self.compile()
+        errors = []
+        for index, value in enumerate(values):
+            try:
+                validate(value)
+            except Exception as e:
+                errors.append((index, value, str(e)))
+                if first:
+                    break
+        return errors
+
+    def shadow(self, value):
+        """ value 表影子列：value_hash 及按字段类型填充的类型化列 """
+        shadow = types[self.type].shadow(value)
+        shadow["value_hash"] = value_hash(value)
+        return shadow
 
     def get_meta(self, **kwargs):
         type_ = types.get(self.type)
@@ -59,6 +113,7 @@ class FieldMeta(dict):
          self.len == other.len and self.nullable == other.nullable
 
     def loads(self, d):
+        self.__dict__.pop("_validator", None)
         if isinstance(d, str):
             d = json.loads(d)
         for k, v in d.items():
@@ -72,23 +127,98 @@ class FieldMeta(dict):
         return json.dumps(self)
 
 
-def pagination(size: int, page: int, query):
-    page = page if page > 0 else 1
+COUNT_MODES = ("exact", "cached", "none")
+_count_cache = {}
+
+
+def encode_cursor(last_id: int) -> str:
+    data = json.dumps({"id": last_id}).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    if not cursor:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return int(json.loads(data)["id"])
+    except Exception:
+        raise ValueError(f"Invalid cursor {cursor}")
+
+
+def count_query(query, count="exact"):
+    """
+    :param count: exact 精确计数；cached 缓存 COUNT_CACHE_TTL 秒的计数；none 不计数
+    """
+    if count not in COUNT_MODES:
+        raise ValueError(f"Invalid count mode {count}")
+    if count == "none":
+        return None
+    if count == "exact":
+        return query.count()
+    compiled = query.statement.compile()
+    key = (str(compiled), repr(sorted(compiled.params.items())))
+    now = time.monotonic()
+    cached = _count_cache.get(key)
+    if cached and cached[1] > now:
+        return cached[0]
+    if len(_count_cache) > 1000:
+        _count_cache.clear()
+    result = query.count()
+    _count_cache[key] = (result, now + COUNT_CACHE_TTL)
+    return result
+
+
+def pagination(size: int, page: int, query, cursor: str = None, count: str = "exact"):
+    """
+    分页查询，cursor 不为 None 时按主键游标分页：首页传空字符串，之后传上一页返回的 next_cursor
+    """
     size = size if 0 < size < 101 else 20
-    count = query.count()
-    pages = math.ceil(count/size)
+    if cursor is not None:
+        model = query.column_descriptions[0]["entity"]
+        last_id = decode_cursor(cursor)
+        seek = query if last_id is None else query.filter(model.id > last_id)
+        results = seek.order_by(model.id).limit(size + 1).all()
+        next_cursor = encode_cursor(results[size - 1].id) if len(results) > size else None
+        count = count_query(query, count)
+        return results[:size], dict(size=size, cursor=cursor, next_cursor=next_cursor, count=count)
+
+    page = page if page > 0 else 1
+    count = count_query(query, count)
+    pages = math.ceil(count/size) if count is not None else None
     results = query.limit(size).offset((page-1)*size).all()
     return results, dict(page=page, size=size, count=count, pages=pages)
 
 
 def itemiter(query, dispatch=100):
-    page = 1
+    """
+    按主键分批遍历查询结果：WHERE id > last_id ORDER BY id LIMIT dispatch，
+    每批不做 COUNT 和 OFFSET，遍历时修改已取出的行也不会跳过后续数据
+    :param query: 单实体查询
+    :param dispatch: 每批数量
+    """
+    model = query.column_descriptions[0]["entity"]
+    last_id = None
     while True:
-        results, _ = pagination(dispatch, page, query)
+        page = query if last_id is None else query.filter(model.id > last_id)
+        results = page.order_by(model.id).limit(dispatch).all()
         if not results:
             break
         yield from results
-        page += 1
+        if len(results) < dispatch:
+            break
+        last_id = results[-1].id
+
+
+def chunked(iterable, size=100):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 
 class RET:
@@ -1,14 +1,68 @@
 import ipaddress
 from datetime import datetime
 
+SHADOW_COLUMNS = ("value_int", "value_float", "value_time", "value_ip", "value_prefix")
+PREFIX_LEN = 64
+
+
+def pack_ip(value) -> int:
+    """ IP 转为整数，IPv4 按 IPv4-mapped IPv6 地址换算，与 IPv6 共用同一数值空间 """
+    address = ipaddress.ip_address(value)
+    if address.version == 4:
+        address = ipaddress.IPv6Address(f"::ffff:{address}")
+    return int(address)
+
 
 class BaseType:
+    column = None  # 等值、范围查询使用的影子列
+    operators = ("eq", "in", "like")
+
     def __init__(self):
         raise NotImplementedError("BaseType class Cannot instantiate")
 
     @classmethod
     def serialize(cls, value, metadata=None):
-        raise NotImplementedError("BaseType not implement method serialize")
+        return cls.compile(metadata or {})(value)
+
+    @classmethod
+    def compile(cls, metadata):
+        """
+        根据元属性生成校验函数，校验失败抛出 ValueError
+        :param metadata: 字段元属性
+        :return: validate(value) -> 序列化后的值
+        """
+        raise NotImplementedError("BaseType not implement method compile")
+
+    @classmethod
+    def shadow(cls, value):
+        """
+        计算 value 表类型化影子列的值
+        :return: {column: value}，未使用的列为 None
+        """
+        shadow = dict.fromkeys(SHADOW_COLUMNS)
+        if value is not None and value != "":
+            shadow.update(cls._shadow(value))
+        return shadow
+
+    @classmethod
+    def _shadow(cls, value):
+        return {}
+
+    @classmethod
+    def coerce(cls, value):
+        """ 查询条件的操作数转换为影子列的值 """
+        return cls._shadow(value)[cls.column]
+
+    @staticmethod
+    def _not_null(validate, metadata):
+        if metadata.get("nullable", True):
+            return validate
+
+        def not_null(value):
+            if not value:
+                raise ValueError("Value is cannot be empty")
+            return validate(value)
+        return not_null
 
     @classmethod
     def unserialize(cls, value):
@@ -26,16 +80,18 @@ class BaseType:
 
 
 class String(BaseType):
+    column = "value_prefix"
+    operators = ("eq", "in", "like", "prefix")
+
     @classmethod
-    def serialize(cls, value, metadata=None):
-        nullable = metadata.get("nullable", True)
-        if not nullable:
-            assert value, "Value is cannot be empty"
+    def compile(cls, metadata):
         len_ = metadata.get("len")
 
-        if len_:
-            assert len(value) <= len_, "The length of the value exceeds the limit"
-        return value
+        def validate(value):
+            if len_ and len(value) > len_:
+                raise ValueError("The length of the value exceeds the limit")
+            return value
+        return cls._not_null(validate, metadata)
 
     @classmethod
     def unserialize(cls, value):
@@ -48,22 +104,29 @@ class String(BaseType):
         meta.update(dict(len=len_, type="String"))
         return meta
 
+    @classmethod
+    def _shadow(cls, value):
+        return {"value_prefix": str(value)[:PREFIX_LEN]}
+
 
 class Int(BaseType):
+    column = "value_int"
+    operators = ("eq", "in", "like", "gt", "gte", "lt", "lte", "between")
+
     @classmethod
-    def serialize(cls, value, metadata=None):
-        nullable = metadata.get("nullable", True)
-        if not nullable:
-            assert value, "Value is cannot be empty"
-        if value:
-            value = int(value)
-            min_ = metadata.get("min")
-            if min_:
-                assert value > min_, f"Value cannot be less than {min_}"
-            max_ = metadata.get("max")
-            if max_:
-                assert value < max_, f"Value cannot be greater than {max_}"
-        return value
+    def compile(cls, metadata):
+        min_ = metadata.get("min")
+        max_ = metadata.get("max")
+
+        def validate(value):
+            if value:
+                value = int(value)
+                if min_ and not value > min_:
+                    raise ValueError(f"Value cannot be less than {min_}")
+                if max_ and not value < max_:
+                    raise ValueError(f"Value cannot be greater than {max_}")
+            return value
+        return cls._not_null(validate, metadata)
 
     @classmethod
     def unserialize(cls, value):
@@ -77,22 +140,29 @@ class Int(BaseType):
         meta.update(dict(min=min_, max=max_, type="Int"))
         return meta
 
+    @classmethod
+    def _shadow(cls, value):
+        return {"value_int": int(value)}
+
 
 class Float(BaseType):
+    column = "value_float"
+    operators = ("eq", "in", "like", "gt", "gte", "lt", "lte", "between")
+
     @classmethod
-    def serialize(cls, value, metadata=None):
-        nullable = metadata.get("nullable", True)
-        if not nullable:
-            assert value, "Value is cannot be empty"
-        if value:
-            value = float(value)
-            min_ = metadata.get("min")
-            if min_:
-                assert value > min_, f"Value cannot be less than {min_}"
-            max_ = metadata.get("max")
-            if max_:
-                assert value < max_, f"Value cannot be greater than {max_}"
-        return value
+    def compile(cls, metadata):
+        min_ = metadata.get("min")
+        max_ = metadata.get("max")
+
+        def validate(value):
+            if value:
+                value = float(value)
+                if min_ and not value > min_:
+                    raise ValueError(f"Value cannot be less than {min_}")
+                if max_ and not value < max_:
+                    raise ValueError(f"Value cannot be greater than {max_}")
+            return value
+        return cls._not_null(validate, metadata)
 
     @classmethod
     def unserialize(cls, value):
@@ -106,16 +176,22 @@ class Float(BaseType):
         meta.update(dict(min=min_, max=max_, type="Float"))
         return meta
 
+    @classmethod
+    def _shadow(cls, value):
+        return {"value_float": float(value)}
+
 
 class Date(BaseType):
+    column = "value_time"
+    operators = ("eq", "in", "like", "gt", "gte", "lt", "lte", "between")
+
     @classmethod
-    def serialize(cls, value, metadata=None):
-        nullable = metadata.get("nullable", True)
-        if not nullable:
-            assert value, "Value is cannot be empty"
-        if value:
-            datetime.strptime(value, "%Y-%m-%d")
-        return value
+    def compile(cls, metadata):
+        def validate(value):
+            if value:
+                datetime.strptime(value, "%Y-%m-%d")
+            return value
+        return cls._not_null(validate, metadata)
 
     @classmethod
     def unserialize(cls, value):
@@ -127,16 +203,22 @@ class Date(BaseType):
         meta.update(type="Date")
         return meta
 
+    @classmethod
+    def _shadow(cls, value):
+        return {"value_time": datetime.strptime(value, "%Y-%m-%d")}
+
 
 class DateTime(BaseType):
+    column = "value_time"
+    operators = ("eq", "in", "like", "gt", "gte", "lt", "lte", "between")
+
     @classmethod
-    def serialize(cls, value, metadata=None):
-        nullable = metadata.get("nullable", True)
-        if not nullable:
-            assert value, "Value is cannot be empty"
-        if value:
-            datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
-        return value
+    def compile(cls, metadata):
+        def validate(value):
+            if value:
+                datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+            return value
+        return cls._not_null(validate, metadata)
 
     @classmethod
     def unserialize(cls, value):
@@ -148,16 +230,22 @@ class DateTime(BaseType):
         meta.update(type="DateTime")
         return meta
 
+    @classmethod
+    def _shadow(cls, value):
+        return {"value_time": datetime.strptime(value, "%Y-%m-%d %H:%M:%S")}
+
 
 class Ip(BaseType):
+    column = "value_ip"
+    operators = ("eq", "in", "like", "gt", "gte", "lt", "lte", "between", "cidr")
+
     @classmethod
-    def serialize(cls, value, metadata=None):
-        nullable = metadata.get("nullable", True)
-        if not nullable:
-            assert value, "Value is cannot be empty"
-        if value:
-            assert ipaddress.ip_address(value), "Value is not legal IP"
-        return value
+    def compile(cls, metadata):
+        def validate(value):
+            if value:
+                ipaddress.ip_address(value)
+            return value
+        return cls._not_null(validate, metadata)
 
     @classmethod
     def unserialize(cls, value):
@@ -169,6 +257,10 @@ class Ip(BaseType):
         meta.update(type="Ip")
         return meta
 
+    @classmethod
+    def _shadow(cls, value):
+        return {"value_ip": pack_ip(value)}
+
 
 types = {}
 
@@ -0,0 +1,79 @@
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from cmdb.tools import FieldMeta
+from settings import VALIDATION_WORKERS, PARALLEL_VALIDATION_THRESHOLD
+
+_executor = None
+
+
+def executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # 首次使用通常在导入线程中，fork 多线程且持有数据库连接的进程可能死锁，子进程以 spawn 方式启动
+        _executor = ProcessPoolExecutor(max_workers=VALIDATION_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        atexit.register(_executor.shutdown)
+    return _executor
+
+
+def _shards(items: list):
+    """ 平均切分为 VALIDATION_WORKERS 份，返回 (起始序号, 分片) """
+    size = -(-len(items) // VALIDATION_WORKERS)
+    for start in range(0, len(items), size):
+        yield start, items[start:start+size]
+
+
+def _validate_values(meta: str, values: list, start: int, first: bool) -> list:
+    # 子进程中执行，元属性以 JSON 传入，编译后的校验函数不可序列化
+    return [(start + index, value, errmsg)
+            for index, value, errmsg in FieldMeta().loads(meta).validate_many(values, first=first)]
+
+
+def _validate_shard(fields: list, rows: list, start: int) -> list:
+    # 子进程中执行
+    return _validate_rows([(name, FieldMeta().loads(meta)) for name, meta in fields], rows, start)
+
+
+def _validate_rows(fields: list, rows: list, start: int) -> list:
+    errors = []
+    for index, row in enumerate(rows, start):
+        for name, meta in fields:
+            value = row.get(name)
+            values = value if meta.multiple and isinstance(value, list) else [value]
+            failed = meta.validate_many(values, first=True)
+            if failed:
+                errors.append((index, name, failed[0][2]))
+                break
+    return errors
+
+
+def validate_values(meta: FieldMeta, values: list, first: bool = False) -> list:
+    """
+    校验一个字段的一批值，数量超过 PARALLEL_VALIDATION_THRESHOLD 时分片到多进程并行校验
+    :param first: 只返回第一个错误
+    :return: [(index, value, errmsg), ...]
+    """
+    if len(values) < PARALLEL_VALIDATION_THRESHOLD or VALIDATION_WORKERS < 2:
+        return meta.validate_many(values, first=first)
+    futures = [executor().submit(_validate_values, meta.dumps(), shard, start, first)
+               for start, shard in _shards(values)]
+    errors = [error for future in futures for error in future.result()]
+    return errors[:1] if first else errors
+
+
+def validate_rows(fields: list, rows: list) -> dict:
+    """
+    按字段元属性校验一批行，单元格数超过 PARALLEL_VALIDATION_THRESHOLD 时按行分片到多进程并行校验
+    :param fields: 字段列表
+    :param rows: [{字段名: 值}, ...]
+    :return: {行序号: (字段名, 错误信息)}，每行只记录第一个错误
+    """
+    if len(rows) * len(fields) < PARALLEL_VALIDATION_THRESHOLD or VALIDATION_WORKERS < 2:
+        errors = _validate_rows([(field.name, field.fieldmeta) for field in fields], rows, 0)
+    else:
+        metas = [(field.name, field.fieldmeta.dumps()) for field in fields]
+        names = [field.name for field in fields]
+        rows = [{name: row.get(name) for name in names} for row in rows]  # 只传需要校验的列
+        futures = [executor().submit(_validate_shard, metas, shard, start) for start, shard in _shards(rows)]
+        errors = [error for future in futures for error in future.result()]
+    return {index: (name, errmsg) for index, name, errmsg in errors}
@@ -6,3 +6,14 @@ BASE_DIR = os.path.dirname(__file__)
 LOG_PATH = f'{BASE_DIR}/logs'
 HOST = "127.0.0.1"
 PORT = "9999"
+COUNT_CACHE_TTL = 60
+ENTITY_DOCUMENT = True
+RESULT_CACHE_ENTRIES = 1000
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_TTL = 60
+IMPORT_PATH = f'{BASE_DIR}/imports'
+VALIDATION_WORKERS = 4  # 并行校验的进程数
+PARALLEL_VALIDATION_THRESHOLD = 5000  # 待校验值的数量超过该值时使用多进程
+GROUP_COMMIT = False  # 合并并发的单行写入，批量提交
+GROUP_COMMIT_WINDOW = 0.005  # 组提交的等待窗口（秒）
+GROUP_COMMIT_BATCH = 500  # 组提交每批的最大行数